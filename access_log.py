@@ -0,0 +1,88 @@
+"""
+Pure ASGI access-log middleware.
+
+Replaces @app.middleware("http") (BaseHTTPMiddleware), which re-wraps every
+response body in an extra task and memory stream. This middleware only
+observes the ASGI send() calls as they pass through: nothing is buffered,
+streaming responses are forwarded chunk by chunk, and per-request state is
+a handful of locals.
+
+The access-log line reports status, total time, time to first byte (first
+http.response.body message), bytes sent and, for text/event-stream
+responses, the number of SSE events.
+"""
+import time
+from typing import Any, Awaitable, Callable, MutableMapping
+from logger import Logger
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+class AccessLogMiddleware:
+    def __init__(self, app: ASGIApp, logger: Logger = None):
+        self.app = app
+        self.logger = logger or Logger.get("FastAPI")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        logger = self.logger
+        start = time.perf_counter()
+        method = scope["method"]
+        path = scope["path"]
+        client = scope.get("client")
+        host, port = client if client else ("unknown", "unknown")
+        logger.info("%s %s:%s %s", method, host, port, path)
+
+        status = 500
+        first_byte = None
+        sent = 0
+        events = 0
+        event_stream = False
+        last_newline = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, first_byte, sent, events, event_stream, last_newline
+            message_type = message["type"]
+            if message_type == "http.response.body":
+                body = message.get("body", b"")
+                if first_byte is None:
+                    first_byte = time.perf_counter()
+                if body:
+                    sent += len(body)
+                    if event_stream:
+                        # 事件以空行结尾；跨块拆分的 "\n\n" 也计入
+                        events += body.count(b"\n\n")
+                        if last_newline and body[0] == 10:
+                            events += 1
+                        last_newline = body[-1] == 10
+            elif message_type == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name.lower() == b"content-type":
+                        event_stream = value.startswith(b"text/event-stream")
+                        break
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if logger.is_enabled(Logger.INFO):
+                # Logger 的格式标记只有 %s/%d/%j，耗时在此处格式化
+                total = f"{time.perf_counter() - start:.4f}s"
+                ttfb = f"{first_byte - start:.4f}s" if first_byte is not None else "-"
+                if event_stream:
+                    logger.info(
+                        "%s %s:%s %s %d %s ttfb=%s bytes=%d events=%d",
+                        method, host, port, path, status, total, ttfb, sent, events
+                    )
+                else:
+                    logger.info(
+                        "%s %s:%s %s %d %s ttfb=%s bytes=%d",
+                        method, host, port, path, status, total, ttfb, sent
+                    )
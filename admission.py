@@ -0,0 +1,156 @@
+"""
+Event-loop lag monitor and admission control for completion requests.
+
+Everything in the proxy shares one asyncio loop, so once the loop falls
+behind every open request slows down together. LoopLagMonitor sleeps for a
+fixed interval and measures how late it wakes up; the lateness is the
+scheduling delay any other callback would see. AdmissionMiddleware is a
+pure ASGI middleware in front of the completion endpoints. It asks the
+AdmissionController before the body is read or validated and rejects the
+request quickly: 503 when the smoothed lag is over the limit, 429 when too
+many requests are already in flight. Both carry Retry-After.
+"""
+import asyncio
+import codec
+import metrics
+from typing import Any, Awaitable, Callable, Dict, MutableMapping, Optional, Tuple
+from logger import Logger
+
+# 准入控制配置：max_lag 为平滑后的事件循环延迟上限（秒），max_in_flight 为并发请求上限，0 表示不限制
+ADMISSION_CONFIG = {
+    'lag_interval': 0.1,
+    'lag_smoothing': 0.3,
+    'max_lag': 0.5,
+    'max_in_flight': 512,
+    'retry_after': 1,
+    'paths': ("/v1/chat/completions",)
+}
+
+Scope = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[MutableMapping[str, Any]]]
+Send = Callable[[MutableMapping[str, Any]], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+class LoopLagMonitor:
+    def __init__(self, interval: Optional[float] = None, smoothing: Optional[float] = None):
+        self.logger = Logger("LoopLagMonitor")
+        self.interval = interval or ADMISSION_CONFIG['lag_interval']
+        self.smoothing = smoothing or ADMISSION_CONFIG['lag_smoothing']
+        self.lag = 0.0  # 最近一次采样
+        self.smoothed = 0.0  # 指数加权平均
+        self.max_lag = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+            self.logger.info(f"Loop lag monitor started (interval: {self.interval}s)")
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.sample(max(0.0, loop.time() - expected))
+
+    def sample(self, lag: float):
+        self.lag = lag
+        # 按经过的时间加权：一次卡顿 1 秒的采样，相当于 1 秒内按间隔采到的所有样本
+        weight = 1 - (1 - self.smoothing) ** ((self.interval + lag) / self.interval)
+        self.smoothed += weight * (lag - self.smoothed)
+        if lag > self.max_lag:
+            self.max_lag = lag
+        metrics.LOOP_LAG.observe(lag)
+
+    def stats(self) -> Dict:
+        return {
+            "lag": self.lag,
+            "smoothed": self.smoothed,
+            "max_lag": self.max_lag,
+            "interval": self.interval
+        }
+
+class AdmissionController:
+    """Admission decisions and counters, shared with AdmissionMiddleware"""
+    def __init__(self, monitor: LoopLagMonitor, max_lag: Optional[float] = None,
+                 max_in_flight: Optional[int] = None, retry_after: Optional[int] = None):
+        self.monitor = monitor
+        self.max_lag = ADMISSION_CONFIG['max_lag'] if max_lag is None else max_lag
+        self.max_in_flight = ADMISSION_CONFIG['max_in_flight'] if max_in_flight is None else max_in_flight
+        self.retry_after = retry_after or ADMISSION_CONFIG['retry_after']
+        self.in_flight = 0
+        self.stats = {
+            "admitted": 0,
+            "rejected_lag": 0,
+            "rejected_in_flight": 0
+        }
+
+    def admit(self) -> Optional[Tuple[int, str]]:
+        """None when the request may proceed, otherwise (status, detail)"""
+        if self.max_lag and self.monitor.smoothed > self.max_lag:
+            self.stats["rejected_lag"] += 1
+            metrics.ADMISSION_REJECTED_LAG.inc()
+            return 503, f"Server overloaded (event loop lag {self.monitor.smoothed * 1000:.0f}ms)"
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            self.stats["rejected_in_flight"] += 1
+            metrics.ADMISSION_REJECTED_IN_FLIGHT.inc()
+            return 429, f"Too many requests in flight ({self.in_flight})"
+        self.stats["admitted"] += 1
+        return None
+
+    def admission_stats(self) -> Dict:
+        stats = dict(self.stats)
+        stats["in_flight"] = self.in_flight
+        stats["max_in_flight"] = self.max_in_flight
+        stats["max_lag"] = self.max_lag
+        stats["loop"] = self.monitor.stats()
+        return stats
+
+class AdmissionMiddleware:
+    def __init__(self, app: ASGIApp, controller: AdmissionController, paths=None):
+        self.app = app
+        self.controller = controller
+        self.paths = frozenset(ADMISSION_CONFIG['paths'] if paths is None else paths)
+        self.retry_after = str(controller.retry_after).encode()
+        self.logger = Logger("Admission")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        controller = self.controller
+        rejected = controller.admit()
+        if rejected is not None:
+            await self._reject(send, *rejected)
+            return
+
+        # 计数覆盖整个响应周期（包括流式输出），直到最后一个 body 发送完
+        controller.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.in_flight -= 1
+
+    async def _reject(self, send: Send, status: int, detail: str) -> None:
+        self.logger.warn("Rejected request with %d: %s", status, detail)
+        body = codec.dumpb({"detail": detail})
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", self.retry_after)
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
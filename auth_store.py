@@ -0,0 +1,81 @@
+"""
+SQLite persistence for authenticated wallets.
+
+One row per wallet holds when it was last authenticated and last used.
+AuthenticationManager collects changes in memory and writes them in
+batches from a worker thread, so the request path never touches the
+database. On startup the most recently used wallets are loaded first and
+re-authenticated in the background before traffic reaches them.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from logger import Logger
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS wallets (
+    address TEXT PRIMARY KEY,
+    authenticated_at REAL,
+    last_used REAL NOT NULL
+)
+"""
+_INDEX = "CREATE INDEX IF NOT EXISTS wallets_last_used ON wallets (last_used DESC)"
+# ?3 (last_used) 为 NULL 表示只更新认证时间；新行以认证时间作为最近使用时间
+_UPSERT = """
+INSERT INTO wallets (address, authenticated_at, last_used) VALUES (?1, ?2, COALESCE(?3, ?2))
+ON CONFLICT (address) DO UPDATE SET
+    authenticated_at = COALESCE(excluded.authenticated_at, wallets.authenticated_at),
+    last_used = CASE WHEN ?3 IS NULL THEN wallets.last_used ELSE MAX(wallets.last_used, ?3) END
+"""
+
+class AuthStore:
+    def __init__(self, path: str):
+        self.logger = Logger("AuthStore")
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # 写入在线程池中执行，同一时间只有一个线程使用连接
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(_SCHEMA)
+        self.connection.execute(_INDEX)
+        self.connection.commit()
+        self.logger.info(f"AuthStore opened at {path}")
+
+    def load(self, limit: int, max_age: float) -> List[str]:
+        """Authenticated wallets used within max_age seconds, most recently used first"""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT address FROM wallets WHERE authenticated_at IS NOT NULL AND last_used >= ? "
+                "ORDER BY last_used DESC LIMIT ?",
+                (time.time() - max_age, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def save(self, rows: Dict[str, Tuple[Optional[float], Optional[float]]], revoked: Iterable[str] = ()) -> None:
+        """Upsert address -> (authenticated_at or None, last_used or None) and delete revoked wallets"""
+        with self.lock:
+            with self.connection:
+                if rows:
+                    self.connection.executemany(
+                        _UPSERT,
+                        ((address, authenticated_at, last_used) for address, (authenticated_at, last_used) in rows.items())
+                    )
+                revoked = list(revoked)
+                if revoked:
+                    self.connection.executemany("DELETE FROM wallets WHERE address = ?", ((address,) for address in revoked))
+
+    def prune(self, max_age: float) -> int:
+        """Drop wallets not used within max_age seconds"""
+        with self.lock:
+            with self.connection:
+                cursor = self.connection.execute("DELETE FROM wallets WHERE last_used < ?", (time.time() - max_age,))
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
@@ -1,24 +1,288 @@
+import time
 import uuid
-import json
+import codec
 import asyncio
-from typing import List
+import metrics
+import timing_wheel
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple, Union
 from logger import Logger
+from wallet_index import WalletIndex, wallet_digest
+from websocket_manager import Session, UpstreamConnection
+from auth_store import AuthStore
+
+# 认证缓存配置：ttl 秒后重新认证，超过 max_entries 时淘汰最久未使用的钱包
+AUTH_CONFIG = {
+    'ttl': 3600,
+    'max_entries': 1000000,
+    # 在认证缓存前加 Bloom 过滤器，快速排除未认证过的钱包
+    'bloom': False,
+    'timeout': 30,
+    # 认证状态持久化（SQLite 文件路径），None 表示不持久化
+    'store_path': None,
+    'store_flush_interval': 5,
+    # 定期删除超过 warm_max_age 未使用的钱包（秒）
+    'store_prune_interval': 3600,
+    # 启动时在后台重新认证最近使用过的钱包
+    'warm_concurrency': 8,
+    'warm_max': 10000,
+    'warm_max_age': 7 * 24 * 3600,
+    # 每条上游连接重连后在后台重新认证的、该连接上最近使用的钱包数
+    'reauth_max': 1000
+}
 
 class AuthenticationManager:
-    def __init__(self, ws_manager):
+    def __init__(self, ws_manager, store: Optional[AuthStore] = None):
         self.logger = Logger("AuthenticationManager")
         self.ws_manager = ws_manager
-        self.authenticated_addresses: List[str] = []
-        self.auth_timeout = 30
+        self.store = store
+        # 待写入 store 的变更：wallet -> (认证时间或 None, 最近使用时间或 None)，以及认证失败需删除的钱包
+        self.dirty: Dict[str, Tuple[Optional[float], Optional[float]]] = {}
+        self.revoked: Set[str] = set()
+        self.flush_task: Optional[asyncio.Task] = None
+        # 后台重新认证任务：启动预热为 "warm"，连接重建后的按连接序号
+        self.reauth_tasks: Dict[Union[str, int], asyncio.Task] = {}
+        # 每条上游连接一个索引：wallet 摘要 -> 在该连接上认证时的连接代数；与连接当前代数不一致的条目视为未认证
+        self.caches = [
+            WalletIndex(AUTH_CONFIG['max_entries'], AUTH_CONFIG['ttl'], bloom=AUTH_CONFIG['bloom'])
+            for _ in ws_manager.pool
+        ]
+        # 每条连接上最近使用的已认证钱包（保留原始地址，该连接重建后按最近使用顺序重新认证），最多 reauth_max 个
+        self.recent: List["OrderedDict[str, None]"] = [OrderedDict() for _ in ws_manager.pool]
+        # 正在进行中的认证，按 (钱包, 连接序号, 连接代数) 合并：同一会话上的并发认证共用一次上游调用
+        self.in_flight: Dict[Tuple[str, int, int], asyncio.Task] = {}
+        # 每条连接上已分配但尚未发出的认证数，选择连接时计入负载，避免同一轮的认证都落到同一条连接
+        self.unsent: List[int] = [0] * len(ws_manager.pool)
+        self.auth_timeout = AUTH_CONFIG['timeout']
+        self.stats = {
+            "upstream": 0,
+            "coalesced": 0,
+            "reauthenticated": 0,
+            "reauth_failed": 0,
+            "reconnects": 0
+        }
+        self.ws_manager.subscribe(self._on_reconnect)
         self.logger.info("AuthenticationManager initialized")
 
-    async def authenticate_wallet(self, wallet_address: str):
+    def auth_metrics(self) -> Dict:
+        stats = dict(self.stats)
+        stats["in_flight"] = len(self.in_flight)
+        stats["caches"] = [cache.cache_stats() for cache in self.caches]
+        stats["generations"] = [conn.generation for conn in self.ws_manager.pool]
+        stats["reauthenticating"] = any(not task.done() for task in self.reauth_tasks.values())
+        return stats
+
+    def authenticated_session(self, wallet_address: str) -> Optional[Session]:
+        """Least loaded live connection the wallet is authenticated on, with its generation"""
+        digest = wallet_digest(wallet_address)
+        best = None
+        for conn in self.ws_manager.pool:
+            if conn.connected and self.caches[conn.index].lookup(digest) == conn.generation:
+                if best is None or len(conn.in_flight) < len(best.in_flight):
+                    best = conn
+        return best.session() if best is not None else None
+
+    def is_authenticated(self, wallet_address: str, conn: Optional[UpstreamConnection] = None) -> bool:
+        """Authenticated on conn's current generation, or on any live connection when conn is None"""
+        if conn is None:
+            return self.authenticated_session(wallet_address) is not None
+        return self.caches[conn.index].get(wallet_address) == conn.generation
+
+    def _on_reconnect(self, conn: UpstreamConnection):
+        """Re-authenticate the wallets recently used on a connection once it is re-established
+
+        Only this connection's auths are lost; the other connections keep
+        theirs. Requests for these wallets meanwhile go to another
+        connection they are authenticated on, or join this re-auth.
+        """
+        # 旧代的认证全部失效，直接清空该连接的索引
+        self.caches[conn.index].clear()
+        recent = self.recent[conn.index]
+        if not recent:
+            return
+        self.stats["reconnects"] += 1
+        wallets = list(reversed(recent))
+        self.logger.info(
+            f"Upstream connection #{conn.index} generation {conn.generation}: re-authenticating {len(wallets)} wallets"
+        )
+        self._start_reauthentication(conn.index, wallets, conn)
+
+    def _start_reauthentication(self, key: Union[str, int], wallets: List[str], conn: Optional[UpstreamConnection] = None):
+        task = self.reauth_tasks.get(key)
+        if task is not None:
+            task.cancel()
+        self.reauth_tasks[key] = asyncio.create_task(self.reauthenticate(wallets, conn))
+
+    async def start_persistence(self):
+        """Start the periodic store flush and warm re-auth of recently used wallets"""
+        if self.store is None:
+            return
+        wallets = await asyncio.to_thread(self.store.load, AUTH_CONFIG['warm_max'], AUTH_CONFIG['warm_max_age'])
+        self.flush_task = asyncio.create_task(self._flush_loop())
+        if wallets:
+            self._start_reauthentication("warm", wallets)
+
+    async def close(self):
+        """Stop background work, write pending changes and close the store"""
+        for task in (*self.reauth_tasks.values(), self.flush_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self.reauth_tasks.clear()
+        self.flush_task = None
+        if self.store is not None:
+            await self.flush()
+            self.store.close()
+
+    async def flush(self):
+        """Write collected changes to the store from a worker thread"""
+        if self.store is None or not (self.dirty or self.revoked):
+            return
+        dirty, self.dirty = self.dirty, {}
+        revoked, self.revoked = self.revoked, set()
         try:
-            masked_address = f"{wallet_address[:6]}...{wallet_address[-4:]}"
-            self.logger.info(f"Authenticating wallet: {masked_address}")
-            if wallet_address in self.authenticated_addresses:
-                self.logger.info(f"Already authenticated wallet: {masked_address}")
-                return True
+            await asyncio.to_thread(self.store.save, dirty, revoked)
+        except Exception as e:
+            self.logger.error(f"Failed to persist auth state: {str(e)}")
+
+    async def _flush_loop(self):
+        next_prune = time.monotonic()
+        while True:
+            await asyncio.sleep(AUTH_CONFIG['store_flush_interval'])
+            await self.flush()
+            if time.monotonic() >= next_prune:
+                next_prune = time.monotonic() + AUTH_CONFIG['store_prune_interval']
+                await self.prune()
+
+    async def prune(self):
+        """Delete wallets unused for longer than warm_max_age; they would never be warmed again"""
+        if self.store is None:
+            return
+        try:
+            pruned = await asyncio.to_thread(self.store.prune, AUTH_CONFIG['warm_max_age'])
+        except Exception as e:
+            self.logger.error(f"Failed to prune auth store: {str(e)}")
+            return
+        if pruned:
+            self.logger.info(f"Pruned {pruned} wallets from the auth store")
+
+    async def reauthenticate(self, wallets: List[str], conn: Optional[UpstreamConnection] = None):
+        """Re-authenticate wallets in order (most recently used first) with bounded concurrency
+
+        Used for warm start (on the least loaded connections) and after a
+        reconnect (on conn). These auths share the in-flight task with live
+        requests for the same wallet, so traffic arriving meanwhile never
+        authenticates twice.
+        """
+        reauthenticated = failed = 0
+        started = time.monotonic()
+        pending = iter(wallets)
+
+        async def worker():
+            nonlocal reauthenticated, failed
+            for wallet_address in pending:
+                if self.is_authenticated(wallet_address, conn):
+                    continue
+                if await self._shared_authentication(wallet_address, conn):
+                    reauthenticated += 1
+                    self.stats["reauthenticated"] += 1
+                else:
+                    failed += 1
+                    self.stats["reauth_failed"] += 1
+
+        self.logger.info(f"Re-authenticating {len(wallets)} wallets")
+        await asyncio.gather(*(worker() for _ in range(max(1, AUTH_CONFIG['warm_concurrency']))))
+        self.logger.info(
+            f"Re-authentication finished in {time.monotonic() - started:.2f}s: "
+            f"{reauthenticated} authenticated, {failed} failed"
+        )
+
+    def _touch(self, wallet_address: str, authenticated_at: Optional[float] = None):
+        """Record a use of the wallet, or with authenticated_at a successful auth
+
+        An auth leaves last_used alone: warm and background re-auths must
+        not make a wallet look recently used.
+        """
+        if self.store is None:
+            return
+        previous = self.dirty.get(wallet_address)
+        if authenticated_at is None:
+            self.dirty[wallet_address] = (previous[0] if previous else None, time.time())
+        else:
+            self.dirty[wallet_address] = (authenticated_at, previous[1] if previous else None)
+
+    def _remember(self, wallet_address: str, index: int):
+        recent = self.recent[index]
+        if wallet_address in recent:
+            recent.move_to_end(wallet_address)
+            return
+        recent[wallet_address] = None
+        if len(recent) > AUTH_CONFIG['reauth_max']:
+            recent.popitem(last=False)
+
+    async def authenticate_wallet(self, wallet_address: str) -> bool:
+        return await self.begin_authentication(wallet_address) is not None
+
+    def begin_authentication(self, wallet_address: str) -> asyncio.Future:
+        """Start authenticating a wallet and return a future for its session
+
+        The future resolves to the (connection, generation) the wallet is
+        authenticated on, or None on failure; completions for the wallet
+        must be sent on that session. The auth is sent by a task, so a
+        caller that wants to overlap local work with the round trip yields
+        once (asyncio.sleep(0)) before that work, letting the request go
+        out first. A cached wallet gets an already-resolved future.
+        """
+        masked_address = f"{wallet_address[:6]}...{wallet_address[-4:]}"
+        self.logger.info("Authenticating wallet: %s", masked_address)
+        session = self.authenticated_session(wallet_address)
+        if session is not None:
+            self.logger.info("Already authenticated wallet: %s", masked_address)
+            metrics.AUTH_CACHE_HITS.inc()
+            self._remember(wallet_address, session[0].index)
+            self._touch(wallet_address)
+            authenticated = asyncio.get_running_loop().create_future()
+            authenticated.set_result(session)
+            return authenticated
+        metrics.AUTH_CACHE_MISSES.inc()
+        self._touch(wallet_address)
+        return self._shared_authentication(wallet_address)
+
+    def _shared_authentication(self, wallet_address: str, conn: Optional[UpstreamConnection] = None) -> asyncio.Future:
+        """Join the in-flight authentication for a wallet on conn, or start one
+
+        Without conn, an authentication already in flight on any connection
+        is joined, otherwise a new one goes to the least loaded connection.
+        """
+        masked_address = f"{wallet_address[:6]}...{wallet_address[-4:]}"
+        for candidate in (self.ws_manager.pool if conn is None else (conn,)):
+            task = self.in_flight.get((wallet_address, candidate.index, candidate.generation))
+            if task is not None:
+                self.stats["coalesced"] += 1
+                self.logger.info("Joining in-flight authentication for wallet: %s", masked_address)
+                # A caller going away must not cancel the authentication for the others
+                return asyncio.shield(task)
+        if conn is None:
+            conn = self._pick_connection()
+        key = (wallet_address, conn.index, conn.generation)
+        self.unsent[conn.index] += 1
+        task = asyncio.create_task(self._authenticate(wallet_address, masked_address, conn))
+        task.add_done_callback(lambda finished: self.in_flight.pop(key, None))
+        self.in_flight[key] = task
+        return asyncio.shield(task)
+
+    def _pick_connection(self) -> UpstreamConnection:
+        """Least loaded connection, counting authentications assigned to it but not sent yet"""
+        unsent = self.unsent
+        return min(self.ws_manager.pool, key=lambda conn: (not conn.connected, len(conn.in_flight) + unsent[conn.index]))
+
+    async def _authenticate(self, wallet_address: str, masked_address: str, conn: UpstreamConnection) -> Optional[Session]:
+        """Send one walletAuth/authenticateWallet request on conn and cache the result"""
+        try:
+            self.stats["upstream"] += 1
             # 发送认证请求
             auth_request = {
                 "method": "walletAuth/authenticateWallet",
@@ -29,26 +293,48 @@ class AuthenticationManager:
                 },
                 "requestId": str(uuid.uuid4())
             }
-            await self.ws_manager.send(json.dumps(auth_request), auth_request["requestId"])
-            
+            # 先注册等待者再发送，避免响应先于等待者到达而被丢弃
+            try:
+                waiter = await self.ws_manager.request(codec.dumps(auth_request), auth_request["requestId"], conn)
+            finally:
+                self.unsent[conn.index] -= 1
+            if waiter is None:
+                self.logger.error(f"Failed to send authentication request for wallet: {masked_address}")
+                return None
+            # 认证结果只对发送时这条连接的这一代有效
+            generation = conn.generation
+
             # 等待认证响应
-            response_queue = self.ws_manager.register_listener(auth_request["requestId"])
+            timer = timing_wheel.schedule(self.auth_timeout, timing_wheel.expire, waiter)
             try:
                 # Get the response with timeout
-                response = await asyncio.wait_for(response_queue.get(), timeout=self.auth_timeout)
+                response = await waiter
                 if response and response.get("code") == 200:
-                    self.authenticated_addresses.append(wallet_address)
-                    self.logger.success(f"Wallet authenticated successfully: {masked_address}")
-                    return True
+                    authenticated_at = time.time()
+                    self.caches[conn.index].set(wallet_address, generation)
+                    self._remember(wallet_address, conn.index)
+                    if self.store is not None:
+                        self.revoked.discard(wallet_address)
+                        self._touch(wallet_address, authenticated_at)
+                    self.logger.success(f"Wallet authenticated successfully on #{conn.index}: {masked_address}")
+                    return conn, generation
                 else:
                     self.logger.error(f"Wallet authentication failed: {response}")
-                    return False
+                    for cache, recent in zip(self.caches, self.recent):
+                        cache.discard(wallet_address)
+                        recent.pop(wallet_address, None)
+                    if self.store is not None:
+                        self.dirty.pop(wallet_address, None)
+                        self.revoked.add(wallet_address)
+                    return None
             except asyncio.TimeoutError:
                 self.logger.error(f"Authentication timeout for wallet: {masked_address}")
-                return False
+                metrics.TIMEOUT_BY_TYPE["auth"].inc()
+                return None
             finally:
-                # Always unregister the listener
-                self.ws_manager.unregister_listener(auth_request["requestId"])
+                # Always cancel the deadline and unregister the waiter
+                timer.cancel()
+                self.ws_manager.unregister_waiter(auth_request["requestId"])
         except Exception as e:
             self.logger.error(f"Error during wallet authentication: {str(e)}")
-            return False
+            return None
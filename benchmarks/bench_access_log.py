@@ -0,0 +1,98 @@
+"""
+Benchmark SSE throughput through the access-log middleware.
+
+Drives a StreamingResponse of pre-rendered SSE events directly through the
+ASGI interface (no sockets) with no middleware, with the old
+@app.middleware("http") (BaseHTTPMiddleware) and with AccessLogMiddleware.
+Log output is discarded.
+
+    python benchmarks/bench_access_log.py [--events 2000] [--requests 200]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from logger import Logger
+from access_log import AccessLogMiddleware
+
+EVENT = b'data: {"id":"chatcmpl-bench","object":"chat.completion.chunk","choices":[{"index":0,"delta":{"content":"token"}}]}\n\n'
+
+
+def build_app(events: int, middleware: str) -> FastAPI:
+    app = FastAPI()
+    logger = Logger.get("Bench")
+
+    @app.get("/stream")
+    async def stream():
+        async def generate():
+            for _ in range(events):
+                yield EVENT
+            yield b"data: [DONE]\n\n"
+        return StreamingResponse(generate(), media_type="text/event-stream")
+
+    if middleware == "http":
+        @app.middleware("http")
+        async def log_requests(request, call_next):
+            start_time = time.time()
+            logger.info(f"{request.method} {request.url.path}")
+            response = await call_next(request)
+            logger.info(f"{request.method} {request.url.path} {response.status_code} {time.time() - start_time:.4f}s")
+            return response
+    elif middleware == "asgi":
+        app.add_middleware(AccessLogMiddleware, logger=logger)
+    return app
+
+
+async def run(app: FastAPI, requests: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/stream", "raw_path": b"/stream",
+        "query_string": b"", "root_path": "", "headers": [],
+        "client": ("127.0.0.1", 1234), "server": ("127.0.0.1", 8000)
+    }
+    received = 0
+
+    def make_receive():
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # 客户端不断开：StreamingResponse 一直等待 http.disconnect，直到响应结束被取消
+            await asyncio.Event().wait()
+        return receive
+
+    async def send(message):
+        nonlocal received
+        if message["type"] == "http.response.body":
+            received += len(message.get("body", b""))
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), make_receive(), send)
+    elapsed = time.perf_counter() - start
+    return received / len(EVENT) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    Logger.targets.append({"colors": 1, "print": lambda line: None})
+    for label, middleware in (("no middleware", None), ("BaseHTTPMiddleware", "http"), ("AccessLogMiddleware", "asgi")):
+        app = build_app(args.events, middleware)
+        asyncio.run(run(app, max(1, args.requests // 10)))  # warm up
+        rate = asyncio.run(run(app, args.requests))
+        print(f"{label:<22}{rate:>14,.0f} events/sec")
+
+
+if __name__ == "__main__":
+    main()
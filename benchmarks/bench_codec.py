@@ -0,0 +1,74 @@
+"""
+Microbenchmark for the codec backends on recorded streaming frames.
+
+Each iteration does what the proxy does per streamed token: decode an
+upstream frame in WebSocketManager._route_message and encode the SSE chunk
+in StreamManager.generate_stream.
+
+    python benchmarks/bench_codec.py [--frames 200000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec
+
+# 录制的上游流式帧（completion/getCompletion, stream=True）
+RECORDED_FRAMES = [
+    '{"requestId": "5f0c8c7e-2b7a-4a55-9d0e-6a3f1e0b9c11", "chunk": "Sure"}',
+    '{"requestId": "5f0c8c7e-2b7a-4a55-9d0e-6a3f1e0b9c11", "chunk": "!"}',
+    '{"requestId": "5f0c8c7e-2b7a-4a55-9d0e-6a3f1e0b9c11", "chunk": " Here"}',
+    '{"requestId": "5f0c8c7e-2b7a-4a55-9d0e-6a3f1e0b9c11", "chunk": " is"}',
+    '{"requestId": "5f0c8c7e-2b7a-4a55-9d0e-6a3f1e0b9c11", "chunk": " a"}',
+    '{"requestId": "5f0c8c7e-2b7a-4a55-9d0e-6a3f1e0b9c11", "chunk": " quick"}',
+    '{"requestId": "5f0c8c7e-2b7a-4a55-9d0e-6a3f1e0b9c11", "chunk": " example"}',
+    '{"requestId": "5f0c8c7e-2b7a-4a55-9d0e-6a3f1e0b9c11", "chunk": ":\\n\\n```python\\n"}',
+    '{"requestId": "5f0c8c7e-2b7a-4a55-9d0e-6a3f1e0b9c11", "chunk": "print(\\"hello\\")"}',
+    '{"requestId": "5f0c8c7e-2b7a-4a55-9d0e-6a3f1e0b9c11", "chunk": "\\n```"}',
+    '{"requestId": "5f0c8c7e-2b7a-4a55-9d0e-6a3f1e0b9c11", "chunk": " \\u4f60\\u597d"}',
+    '{"requestId": "5f0c8c7e-2b7a-4a55-9d0e-6a3f1e0b9c11", "chunk": "\\uff0c\\u4e16\\u754c"}',
+    '{"requestId": "5f0c8c7e-2b7a-4a55-9d0e-6a3f1e0b9c11", "isStreamEnd": true}',
+]
+
+
+def run(frames: int) -> float:
+    recorded = RECORDED_FRAMES
+    count = len(recorded)
+    start = time.perf_counter()
+    for i in range(frames):
+        data = codec.loads(recorded[i % count])
+        chunk = {
+            "id": data["requestId"],
+            "object": "chat.completion.chunk",
+            "created": 1700000000,
+            "model": "gpt-4o",
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": {
+                        "content": data.get("chunk", "")
+                    },
+                    "finish_reason": None
+                }
+            ]
+        }
+        f"data: {codec.dumps(chunk)}\n\n"
+    return frames / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--frames", type=int, default=200000)
+    args = parser.parse_args()
+
+    for name in codec.available_backends():
+        codec.use(name)
+        run(min(args.frames, 10000))  # warm up
+        print(f"{name:>8}: {run(args.frames):>12,.0f} frames/sec")
+
+
+if __name__ == "__main__":
+    main()
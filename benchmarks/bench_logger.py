@@ -0,0 +1,70 @@
+"""
+Microbenchmark for Logger construction and for calls disabled by level.
+
+    python benchmarks/bench_logger.py [--iterations 1000000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger import Logger
+
+
+def timeit(label: str, func, iterations: int) -> None:
+    start = time.perf_counter()
+    func(iterations)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34}{iterations / elapsed:>14,.0f} ops/sec{elapsed / iterations * 1e9:>10.0f} ns/op")
+
+
+def construct(n: int) -> None:
+    for _ in range(n):
+        Logger("ChatCompletions")
+
+
+def registry(n: int) -> None:
+    for _ in range(n):
+        Logger.get("ChatCompletions")
+
+
+def disabled_call(n: int) -> None:
+    logger = Logger.get("ChatCompletions")
+    request_id = "5f0c8c7e-2b7a-4a55-9d0e-6a3f1e0b9c11"
+    for _ in range(n):
+        logger.debug(f"Request details: {request_id}")
+
+
+def disabled_deferred(n: int) -> None:
+    logger = Logger.get("ChatCompletions")
+    request_id = "5f0c8c7e-2b7a-4a55-9d0e-6a3f1e0b9c11"
+    for _ in range(n):
+        logger.debug("Request details: %s", request_id)
+
+
+def disabled_guard(n: int) -> None:
+    logger = Logger.get("ChatCompletions")
+    for _ in range(n):
+        if logger.is_enabled(Logger.DEBUG):
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=1000000)
+    args = parser.parse_args()
+
+    # 与 main.py 相同的默认输出目标；基础级别为 INFO，debug 调用被禁用
+    Logger.targets.append({"colors": 1, "print": lambda line: None})
+
+    timeit("Logger(name)", construct, args.iterations)
+    timeit("Logger.get(name)", registry, args.iterations)
+    timeit("debug(f-string) disabled", disabled_call, args.iterations)
+    timeit("debug('%s', arg) disabled", disabled_deferred, args.iterations)
+    timeit("is_enabled(DEBUG)", disabled_guard, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
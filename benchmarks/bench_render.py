@@ -0,0 +1,60 @@
+"""
+Benchmark rendered log lines/sec through Logger.render.
+
+Uses the default target set up in main.py ({"colors": 1, "print": print})
+and the same target with showTime, writing into a discarded sink.
+
+    python benchmarks/bench_render.py [--lines 200000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger import Logger
+
+NAMES = ["WebSocketManager", "StreamManager", "RequestManager", "FastAPI"]
+
+
+def run(target: dict, lines: int) -> float:
+    timestamp = int(time.time() * 1000)
+    records = [
+        {
+            "id": i,
+            "type": "info",
+            "level": Logger.INFO,
+            "name": NAMES[i % len(NAMES)],
+            "meta": None,
+            "content": f"Message routed to queue for request_id: 5f0c8c7e-2b7a-4a55-9d0e-6a3f1e0b9c{i % 100:02d}",
+            # 约每 8 条记录前进 1 毫秒
+            "timestamp": timestamp + i // 8
+        }
+        for i in range(lines)
+    ]
+    render = Logger.render
+    sink = target["print"]
+    start = time.perf_counter()
+    for record in records:
+        sink(render(target, record))
+    return lines / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lines", type=int, default=200000)
+    args = parser.parse_args()
+
+    discard = lambda line: None
+    targets = {
+        "main.py default": {"colors": 1, "print": discard},
+        "with showTime": {"colors": 1, "showTime": "yyyy-MM-dd hh:mm:ss.SSS", "print": discard},
+    }
+    for label, target in targets.items():
+        run(target, min(args.lines, 10000))  # warm up
+        print(f"{label:<18}{run(target, args.lines):>14,.0f} lines/sec")
+
+
+if __name__ == "__main__":
+    main()
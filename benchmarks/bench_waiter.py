@@ -0,0 +1,105 @@
+"""
+Benchmark non-stream response waits: the former asyncio.Queue + two tasks
++ asyncio.wait path against the one-shot future resolved by
+WebSocketManager._route_message.
+
+Reports requests/sec and memory per pending waiter (tracemalloc).
+
+    python benchmarks/bench_waiter.py [--waiters 10000] [--rounds 5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec
+from manager import BaseManager
+from websocket_manager import WebSocketManager
+
+
+async def legacy_wait(queue: asyncio.Queue, timeout: float):
+    """The previous BaseManager.wait_for_response, minus logging"""
+    response_task = asyncio.create_task(queue.get())
+    timeout_task = asyncio.create_task(asyncio.sleep(timeout))
+    done, pending = await asyncio.wait(
+        [response_task, timeout_task],
+        return_when=asyncio.FIRST_COMPLETED
+    )
+    for task in pending:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    return response_task.result()
+
+
+def frames(count: int):
+    return [codec.dumps({"requestId": f"req-{i}", "code": 200, "response": "ok"}) for i in range(count)]
+
+
+async def run_legacy(ws: WebSocketManager, count: int, measure_memory: bool):
+    messages = frames(count)
+    queues = [ws.register_listener(f"req-{i}") for i in range(count)]
+    if measure_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(legacy_wait(queue, 30)) for queue in queues]
+    await asyncio.sleep(0)
+    memory = tracemalloc.get_traced_memory()[0] if measure_memory else 0
+    for message in messages:
+        ws._route_message(message)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    if measure_memory:
+        tracemalloc.stop()
+    for i in range(count):
+        ws.unregister_listener(f"req-{i}")
+    return count / elapsed, memory / count
+
+
+async def run_waiter(ws: WebSocketManager, manager: BaseManager, count: int, measure_memory: bool):
+    messages = frames(count)
+    for i in range(count):
+        manager.create_waiter(f"req-{i}")
+    if measure_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(manager.wait_for_response(f"req-{i}", 30)) for i in range(count)]
+    await asyncio.sleep(0)
+    memory = tracemalloc.get_traced_memory()[0] if measure_memory else 0
+    for message in messages:
+        ws._route_message(message)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    if measure_memory:
+        tracemalloc.stop()
+    return count / elapsed, memory / count
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--waiters", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    ws = WebSocketManager("ws://unused")
+    manager = BaseManager(ws)
+
+    # Memory is measured in a separate round: tracemalloc slows everything down
+    _, legacy_mem = await run_legacy(ws, args.waiters, True)
+    _, waiter_mem = await run_waiter(ws, manager, args.waiters, True)
+    legacy_rps = max([(await run_legacy(ws, args.waiters, False))[0] for _ in range(args.rounds)])
+    waiter_rps = max([(await run_waiter(ws, manager, args.waiters, False))[0] for _ in range(args.rounds)])
+
+    print(f"{'path':<22}{'requests/sec':>15}{'bytes/waiter':>15}")
+    print(f"{'queue + 2 tasks':<22}{legacy_rps:>15,.0f}{legacy_mem:>15,.0f}")
+    print(f"{'one-shot future':<22}{waiter_rps:>15,.0f}{waiter_mem:>15,.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
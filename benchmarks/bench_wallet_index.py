@@ -0,0 +1,86 @@
+"""
+Benchmark auth membership structures: memory per million wallets and lookups/sec.
+
+Compares the original List[str] (authenticated_addresses), the
+ResponseCache (OrderedDict LRU) and WalletIndex with and without the
+Bloom filter front. Memory is what the structure keeps alive, measured
+with tracemalloc while it is filled with fresh address strings. Lookups
+are split into hits (known wallets) and misses (never seen).
+
+    python benchmarks/bench_wallet_index.py [--wallets 1000000] [--lookups 200000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_cache import ResponseCache
+from wallet_index import WalletIndex
+
+
+def addresses(count: int, seed: int):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield f"0x{rng.getrandbits(160):040x}"
+
+
+def build(kind: str, wallets: int):
+    tracemalloc.start()
+    if kind == "list":
+        structure = []
+        for address in addresses(wallets, 1):
+            structure.append(address)
+    elif kind == "ResponseCache":
+        structure = ResponseCache(max_entries=wallets, max_bytes=1 << 40, ttl=3600)
+        for address in addresses(wallets, 1):
+            structure.set(address, (1, time.time()))
+    else:
+        structure = WalletIndex(wallets, 3600, bloom=kind == "WalletIndex+bloom")
+        for address in addresses(wallets, 1):
+            structure.set(address, 1)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return structure, current
+
+
+def lookups_per_sec(kind: str, structure, probes) -> float:
+    if kind == "list":
+        contains = structure.__contains__
+    else:
+        get = structure.get
+        contains = lambda address: get(address) is not None
+    start = time.perf_counter()
+    for address in probes:
+        contains(address)
+    return len(probes) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--wallets", type=int, default=1000000)
+    parser.add_argument("--lookups", type=int, default=200000)
+    args = parser.parse_args()
+
+    known = list(addresses(args.wallets, 1))
+    rng = random.Random(3)
+    hits = [known[rng.randrange(args.wallets)] for _ in range(args.lookups)]
+    misses = list(addresses(args.lookups, 2))
+    scale = 1000000 / args.wallets
+
+    print(f"{'structure':<20}{'MB per 1M':>12}{'bytes/wallet':>14}{'hit lookups/s':>16}{'miss lookups/s':>16}")
+    for kind in ("list", "ResponseCache", "WalletIndex", "WalletIndex+bloom"):
+        structure, memory = build(kind, args.wallets)
+        # List 的查找是 O(n) 扫描，只测少量查找
+        count = min(args.lookups, 200) if kind == "list" else args.lookups
+        hit_rate = lookups_per_sec(kind, structure, hits[:count])
+        miss_rate = lookups_per_sec(kind, structure, misses[:count])
+        print(f"{kind:<20}{memory * scale / 1e6:>12.1f}{memory / args.wallets:>14.1f}{hit_rate:>16,.0f}{miss_rate:>16,.0f}")
+        del structure
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+JSON codec shared by the upstream frame path and SSE output.
+
+Picks orjson or msgspec when installed and falls back to the stdlib json
+module otherwise. Every backend emits compact separators and UTF-8 without
+ASCII escaping, so the wire format does not depend on what is installed.
+"""
+import json
+from typing import Any, Callable, Dict, List, Tuple
+
+# 按优先级排列的后端
+PREFERRED_BACKENDS = ["orjson", "msgspec", "json"]
+
+
+def _load_orjson() -> Tuple[Callable, Callable, Tuple]:
+    import orjson
+
+    def dumpb(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    return dumpb, orjson.loads, (orjson.JSONDecodeError,)
+
+
+def _load_msgspec() -> Tuple[Callable, Callable, Tuple]:
+    import msgspec
+
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+    return encoder.encode, decoder.decode, (msgspec.DecodeError, ValueError)
+
+
+def _load_json() -> Tuple[Callable, Callable, Tuple]:
+    encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+    def dumpb(obj: Any) -> bytes:
+        return encoder.encode(obj).encode("utf-8")
+
+    return dumpb, json.loads, (json.JSONDecodeError,)
+
+
+_LOADERS: Dict[str, Callable[[], Tuple[Callable, Callable, Tuple]]] = {
+    "orjson": _load_orjson,
+    "msgspec": _load_msgspec,
+    "json": _load_json,
+}
+
+backend: str = ""
+dumpb: Callable[[Any], bytes]
+loads: Callable[[Any], Any]
+DecodeError: Tuple = (ValueError,)
+
+
+def dumps(obj: Any) -> str:
+    """Serialize to a compact JSON str (for WebSocket text frames)"""
+    return dumpb(obj).decode("utf-8")
+
+
+def available_backends() -> List[str]:
+    """Backends that can be imported in this environment, in preference order"""
+    names = []
+    for name in PREFERRED_BACKENDS:
+        try:
+            _LOADERS[name]()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def use(name: str) -> None:
+    """Switch the process-wide backend"""
+    global backend, dumpb, loads, DecodeError
+    if name not in _LOADERS:
+        raise ValueError(f"Unknown JSON backend: {name}")
+    dumpb, loads, DecodeError = _LOADERS[name]()
+    backend = name
+
+
+for _name in PREFERRED_BACKENDS:
+    try:
+        use(_name)
+        break
+    except ImportError:
+        continue
@@ -0,0 +1,261 @@
+"""
+Persistent completion cache shared between worker processes on one host.
+
+Layout:
+  <path>/cache.dat  append-only data file of length-prefixed JSON records
+  <path>/cache.idx  memory-mapped open-addressing hash index
+
+Each index slot holds a 16-byte key digest, plus the offset and length of
+the record in the data file and the time it was stored. Writers take an
+exclusive flock on the index. They append the record first and publish the
+slot afterwards, writing the digest last. Readers never lock. They check
+the key stored in the record itself, so a half-written slot is a miss and
+never returns wrong data.
+
+When the data file or the index is full, a writer sweeps the cache under
+the same lock: live records are moved down over the space of expired and
+overwritten ones, the index is rebuilt from the survivors and the data
+file is truncated. The files keep their inodes, so other processes keep
+their descriptors; a reader racing the sweep sees a moved record as a
+miss. Sweeps run at most once per sweep_interval in each process, so a
+cache full of live entries rejects writes cheaply instead of rescanning
+on every put. put() takes a blocking flock and does file I/O, and get()
+probes the index and preads the record; the request path calls
+put_background() and get_background(), which run them in the default
+executor.
+"""
+import os
+import mmap
+import asyncio
+import time
+import fcntl
+import struct
+import hashlib
+import threading
+import codec
+from typing import Any, Dict, Optional
+from logger import Logger
+
+# 磁盘缓存配置，path 为 None 时不启用
+DISK_CACHE_CONFIG = {
+    'path': None,
+    'slots': 1 << 16,
+    'max_bytes': 1024 * 1024 * 1024,
+    'ttl': 7 * 24 * 3600,
+    # 数据文件或索引写满时，回收过期记录的最短间隔（秒）
+    'sweep_interval': 60
+}
+
+# 记录类型
+KIND_RESPONSE = b"r"
+KIND_STREAM = b"s"
+
+_MAGIC = b"HKYC"
+_HEADER = struct.Struct("<4sIII")   # magic, version, slot count, used slots
+_USED = struct.Struct("<I")
+_SLOT = struct.Struct("<16sQId")    # digest, offset, length, stored_at
+_RECORD_LENGTH = struct.Struct("<I")
+_VERSION = 1
+_EMPTY = bytes(16)
+_MAX_LOAD = 0.7
+
+class DiskCache:
+    def __init__(self, path: str, slots: Optional[int] = None, max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None, readonly: bool = False):
+        self.logger = Logger("DiskCache")
+        self.path = path
+        self.readonly = readonly
+        self.max_bytes = max_bytes or DISK_CACHE_CONFIG['max_bytes']
+        self.ttl = ttl or DISK_CACHE_CONFIG['ttl']
+        self.lock = threading.Lock()
+        self.next_sweep = 0.0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "rejected": 0,
+            "sweeps": 0,
+            "reclaimed_bytes": 0,
+            "write_errors": 0
+        }
+
+        if not readonly:
+            os.makedirs(path, exist_ok=True)
+        data_flags = os.O_RDONLY if readonly else os.O_RDWR | os.O_CREAT | os.O_APPEND
+        self.data_fd = os.open(os.path.join(path, "cache.dat"), data_flags, 0o644)
+        index_flags = os.O_RDONLY if readonly else os.O_RDWR | os.O_CREAT
+        self.index_fd = os.open(os.path.join(path, "cache.idx"), index_flags, 0o644)
+        if not readonly:
+            self._init_index(slots or DISK_CACHE_CONFIG['slots'])
+        self.index = mmap.mmap(
+            self.index_fd, 0,
+            access=mmap.ACCESS_READ if readonly else mmap.ACCESS_WRITE
+        )
+        magic, version, self.slots, _ = _HEADER.unpack_from(self.index, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"Not a disk cache index: {path}")
+        self.mask = self.slots - 1
+        self.logger.info(f"DiskCache opened at {path} ({self.slots} slots, readonly={readonly})")
+
+    def _init_index(self, slots: int):
+        """Create the index file on first use; slot count is rounded up to a power of two"""
+        fcntl.flock(self.index_fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.index_fd).st_size == 0:
+                slots = 1 << max(slots - 1, 1).bit_length()
+                os.ftruncate(self.index_fd, _HEADER.size + slots * _SLOT.size)
+                os.pwrite(self.index_fd, _HEADER.pack(_MAGIC, _VERSION, slots, 0), 0)
+        finally:
+            fcntl.flock(self.index_fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _digest(kind: bytes, key: str) -> bytes:
+        return hashlib.blake2b(kind + key.encode("utf-8"), digest_size=16).digest()
+
+    def _probe(self, digest: bytes):
+        """Yield slot offsets along the linear probe sequence for digest"""
+        start = int.from_bytes(digest[:8], "little") & self.mask
+        for i in range(self.slots):
+            yield _HEADER.size + ((start + i) & self.mask) * _SLOT.size
+
+    def _find(self, digest: bytes):
+        """Return (slot offset, slot tuple) for digest, or the first empty slot"""
+        for pos in self._probe(digest):
+            slot = _SLOT.unpack_from(self.index, pos)
+            if slot[0] == digest or slot[0] == _EMPTY:
+                return pos, slot
+        return None, None
+
+    def get(self, kind: bytes, key: str) -> Optional[Any]:
+        digest = self._digest(kind, key)
+        pos, slot = self._find(digest)
+        if slot is None or slot[0] != digest or time.time() - slot[3] > self.ttl:
+            self.stats["misses"] += 1
+            return None
+        try:
+            raw = os.pread(self.data_fd, slot[2], slot[1])
+            (length,) = _RECORD_LENGTH.unpack_from(raw, 0)
+            record = codec.loads(raw[_RECORD_LENGTH.size:_RECORD_LENGTH.size + length])
+        except (OSError, struct.error, *codec.DecodeError) as e:
+            self.logger.warn(f"Unreadable disk cache record: {str(e)}")
+            self.stats["misses"] += 1
+            return None
+        if not isinstance(record, dict) or record.get("key") != key or record.get("kind") != kind.decode():
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return record["value"]
+
+    def put(self, kind: bytes, key: str, value: Any) -> bool:
+        if self.readonly:
+            return False
+        body = codec.dumpb({"key": key, "kind": kind.decode(), "value": value})
+        record = _RECORD_LENGTH.pack(len(body)) + body
+        digest = self._digest(kind, key)
+        with self.lock:
+            fcntl.flock(self.index_fd, fcntl.LOCK_EX)
+            try:
+                placed = self._place(digest, len(record))
+                if placed is None and time.time() >= self.next_sweep:
+                    self._sweep()
+                    placed = self._place(digest, len(record))
+                if placed is None:
+                    self.stats["rejected"] += 1
+                    return False
+                offset, pos, used, is_new = placed
+                os.write(self.data_fd, record)
+                # Publish offset/length first and the digest last
+                self.index[pos + 16:pos + _SLOT.size] = _SLOT.pack(digest, offset, len(record), time.time())[16:]
+                self.index[pos:pos + 16] = digest
+                if is_new:
+                    _USED.pack_into(self.index, 12, used + 1)
+                self.stats["writes"] += 1
+                return True
+            finally:
+                fcntl.flock(self.index_fd, fcntl.LOCK_UN)
+
+    def get_background(self, kind: bytes, key: str) -> asyncio.Future:
+        """Run get() in the default executor so a slow disk never blocks the event loop"""
+        return asyncio.get_running_loop().run_in_executor(None, self.get, kind, key)
+
+    def put_background(self, kind: bytes, key: str, value: Any) -> asyncio.Future:
+        """Run put() in the default executor so the flock and file I/O never block the event loop"""
+        future = asyncio.get_running_loop().run_in_executor(None, self.put, kind, key, value)
+        future.add_done_callback(self._put_done)
+        return future
+
+    def _put_done(self, future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            self.stats["write_errors"] += 1
+            self.logger.error(f"Failed to write disk cache record: {str(future.exception())}")
+
+    def _place(self, digest: bytes, length: int):
+        """(data offset, slot offset, used slots, new slot) for a record, or None when the cache is full"""
+        offset = os.fstat(self.data_fd).st_size
+        if offset + length > self.max_bytes:
+            return None
+        pos, slot = self._find(digest)
+        used = self._used()
+        is_new = pos is not None and slot[0] == _EMPTY
+        if pos is None or (is_new and used >= self.slots * _MAX_LOAD):
+            return None
+        return offset, pos, used, is_new
+
+    def _sweep(self):
+        """Drop expired and overwritten records, compact the data file and rebuild the index
+
+        Called with the flock held. Records are copied in offset order,
+        each to an offset no later than its own, so nothing is overwritten
+        before it has been read.
+        """
+        now = time.time()
+        self.next_sweep = now + DISK_CACHE_CONFIG['sweep_interval']
+        live = []
+        for index in range(self.slots):
+            slot = _SLOT.unpack_from(self.index, _HEADER.size + index * _SLOT.size)
+            if slot[0] != _EMPTY and now - slot[3] <= self.ttl:
+                live.append(slot)
+        live.sort(key=lambda slot: slot[1])
+        size = os.fstat(self.data_fd).st_size
+
+        # 数据文件以 O_APPEND 打开，pwrite 会忽略偏移量，搬移记录需要另一个描述符
+        fd = os.open(os.path.join(self.path, "cache.dat"), os.O_RDWR)
+        try:
+            moved = []
+            write_pos = 0
+            for digest, offset, length, stored_at in live:
+                if offset != write_pos:
+                    os.pwrite(fd, os.pread(fd, length, offset), write_pos)
+                moved.append((digest, write_pos, length, stored_at))
+                write_pos += length
+
+            # 先清空索引再写回存活条目；读取方在此期间只会未命中
+            self.index[_HEADER.size:] = bytes(self.slots * _SLOT.size)
+            for digest, offset, length, stored_at in moved:
+                pos, _ = self._find(digest)
+                self.index[pos + 16:pos + _SLOT.size] = _SLOT.pack(digest, offset, length, stored_at)[16:]
+                self.index[pos:pos + 16] = digest
+            _USED.pack_into(self.index, 12, len(moved))
+            os.ftruncate(fd, write_pos)
+        finally:
+            os.close(fd)
+        self.stats["sweeps"] += 1
+        self.stats["reclaimed_bytes"] += size - write_pos
+        self.logger.info(f"Disk cache sweep kept {len(moved)} records, reclaimed {size - write_pos} bytes")
+
+    def _used(self) -> int:
+        return _USED.unpack_from(self.index, 12)[0]
+
+    def cache_stats(self) -> Dict:
+        stats = dict(self.stats)
+        stats["data_bytes"] = os.fstat(self.data_fd).st_size
+        stats["used_slots"] = self._used()
+        stats["slots"] = self.slots
+        return stats
+
+    def close(self):
+        try:
+            self.index.close()
+        finally:
+            os.close(self.index_fd)
+            os.close(self.data_fd)
@@ -0,0 +1,193 @@
+"""
+Batched, rotating file target for Logger.targets.
+
+Callers only append the rendered line (or the JSON-encoded record) to an
+in-memory batch. A flusher thread writes each batch with a single write()
+call and rotates the file by size or age. Rotated files are gzipped by a
+separate compressor thread, so neither file I/O nor compression runs on
+the event loop.
+"""
+import os
+import glob
+import gzip
+import queue
+import shutil
+import threading
+import time
+import codec
+from typing import Any, List, Optional
+from logger import Logger, Target, Record
+
+class FileTarget:
+    def __init__(self, path: str, format: str = "plain", max_bytes: int = 256 * 1024 * 1024,
+                 rotate_interval: Optional[float] = None, backups: int = 10, compress: bool = True,
+                 batch_size: int = 512, flush_interval: float = 0.5,
+                 show_time: str = "yyyy-MM-dd hh:mm:ss.SSS", levels: Any = None):
+        if format not in ("plain", "json"):
+            raise ValueError(f"Unknown log file format: {format}")
+        self.path = path
+        self.format = format
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backups = backups
+        self.compress = compress
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.show_time = show_time
+        self.levels = levels
+
+        self.lock = threading.Lock()
+        self.batch: List[str] = []
+        self.wakeup = threading.Event()
+        self.running = True
+        # 写入或轮转失败（磁盘满、权限等）时丢弃该批并计数，恢复前只报告一次
+        self.failing = False
+        self.stats = {
+            "written": 0,
+            "flushes": 0,
+            "rotations": 0,
+            "errors": 0,
+            "dropped": 0
+        }
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._open()
+
+        self.compress_queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self.flusher = threading.Thread(target=self._flush_loop, name="FileTarget-flush", daemon=True)
+        self.compressor = threading.Thread(target=self._compress_loop, name="FileTarget-gzip", daemon=True)
+        self.flusher.start()
+        self.compressor.start()
+
+    def target(self) -> Target:
+        """Target dict to append to Logger.targets"""
+        target: Target = {"colors": 0}
+        if self.format == "json":
+            target["record"] = self.write_record
+        else:
+            target["showTime"] = self.show_time
+            target["print"] = self.write_line
+        if self.levels is not None:
+            target["levels"] = self.levels
+        return target
+
+    def write_line(self, line: str) -> None:
+        self._append(line + "\n")
+
+    def write_record(self, record: Record) -> None:
+        self._append(codec.dumps({
+            "id": record["id"],
+            "timestamp": record["timestamp"],
+            "type": record["type"],
+            "level": record["level"],
+            "name": record["name"],
+            "content": record["content"]
+        }) + "\n")
+
+    def _append(self, text: str) -> None:
+        with self.lock:
+            self.batch.append(text)
+            full = len(self.batch) >= self.batch_size
+        if full:
+            self.wakeup.set()
+
+    def _flush_loop(self) -> None:
+        while self.running:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            batch, self.batch = self.batch, []
+        written = False
+        try:
+            if self.file.closed:
+                # 上次轮转在重新打开文件之前失败
+                self._open()
+            if batch:
+                data = "".join(batch)
+                self.file.write(data)
+                self.file.flush()
+                written = True
+                self.size += len(data.encode("utf-8"))
+                self.stats["written"] += len(batch)
+                self.stats["flushes"] += 1
+            if self._should_rotate():
+                self._rotate()
+        except (OSError, ValueError) as e:
+            self._failed(e, 0 if written else len(batch))
+            return
+        if self.failing and written:
+            self.failing = False
+            Logger.get("FileTarget").info(
+                f"Log file {self.path} writable again ({self.stats['dropped']} lines dropped so far)"
+            )
+
+    def _failed(self, error: Exception, dropped: int) -> None:
+        self.stats["errors"] += 1
+        self.stats["dropped"] += dropped
+        if not self.failing:
+            self.failing = True
+            Logger.get("FileTarget").error(f"Failed to write log file {self.path}: {str(error)}")
+
+    def _open(self) -> None:
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.size = self.file.tell()
+        self.opened_at = time.time()
+
+    def _should_rotate(self) -> bool:
+        if self.size >= self.max_bytes:
+            return True
+        return bool(self.rotate_interval) and self.size > 0 and time.time() - self.opened_at >= self.rotate_interval
+
+    def _rotate(self) -> None:
+        self.file.close()
+        rotated = f"{self.path}.{time.strftime('%Y%m%d-%H%M%S')}"
+        suffix = 1
+        while os.path.exists(rotated) or os.path.exists(rotated + ".gz"):
+            rotated = f"{self.path}.{time.strftime('%Y%m%d-%H%M%S')}.{suffix}"
+            suffix += 1
+        os.replace(self.path, rotated)
+        self._open()
+        self.stats["rotations"] += 1
+        if self.compress:
+            self.compress_queue.put(rotated)
+        else:
+            self._prune()
+
+    def _compress_loop(self) -> None:
+        while True:
+            rotated = self.compress_queue.get()
+            if rotated is None:
+                break
+            try:
+                with open(rotated, "rb") as source, gzip.open(rotated + ".gz", "wb") as target:
+                    shutil.copyfileobj(source, target)
+                os.remove(rotated)
+            except OSError as e:
+                Logger.get("FileTarget").error(f"Failed to compress {rotated}: {str(e)}")
+            self._prune()
+
+    def _prune(self) -> None:
+        """Keep only the newest `backups` rotated files"""
+        rotated = sorted(
+            (p for p in glob.glob(glob.escape(self.path) + ".*")),
+            key=os.path.getmtime,
+            reverse=True
+        )
+        for stale in rotated[self.backups:]:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        self.running = False
+        self.wakeup.set()
+        self.flusher.join()
+        self.flush()
+        self.file.close()
+        self.compress_queue.put(None)
+        self.compressor.join()
@@ -0,0 +1,111 @@
+"""
+Fixed-size in-memory log ring buffer for Logger.targets.
+
+The ring keeps the most recent `capacity` records at or above `level` in
+one preallocated slot list. Writing a record stores a compact copy of its
+arguments in the next slot: strings, truncated so the whole record stays
+within `max_record` characters, with other objects rendered by a bounded
+repr. A slot never keeps request data alive, so the ring holds at most
+about capacity * max_record characters. Formatting is left to query time.
+
+Slots are reserved under a small lock, since records arrive from the
+event loop and from worker threads (log queue, file target). Each slot is
+then replaced by a single tuple assignment, so query() can run in a worker
+thread while writers keep going.
+"""
+import reprlib
+import threading
+from typing import Any, Dict, List, Optional
+from logger import Logger, Target
+
+class LogRing:
+    def __init__(self, capacity: int = 65536, level: int = Logger.INFO, max_record: int = 512):
+        self.capacity = capacity
+        self.level = level
+        self.max_record = max_record
+        self.next = 0  # 累计写入条数；下一条写入 next % capacity
+        self.lock = threading.Lock()
+        # 每个槽位：(序号, id, 时间戳, 级别, 类型, 名称, 参数)
+        self.slots: List[Optional[tuple]] = [None] * capacity
+        self.repr = reprlib.Repr()
+        self.repr.maxstring = self.repr.maxother = max_record
+        self.repr.maxlevel = 3
+        self.format_target: Target = {"colors": 0}
+
+    def target(self) -> Target:
+        """Target dict to append to Logger.targets"""
+        return {
+            "colors": 0,
+            "levels": {"base": self.level},
+            "raw": self.write
+        }
+
+    def write(self, record_id: int, timestamp: int, level: int, type_name: str, name: str, args: tuple) -> None:
+        compact = self._compact(args)
+        with self.lock:
+            index = self.next
+            self.next = index + 1
+        self.slots[index % self.capacity] = (index, record_id, timestamp, level, type_name, name, compact)
+
+    def _compact(self, args: tuple) -> tuple:
+        """Copy args as strings sharing a budget of max_record characters"""
+        budget = self.max_record
+        compact = []
+        for arg in args:
+            if type(arg) is not str:
+                arg = str(arg) if isinstance(arg, (int, float, Exception)) else self.repr.repr(arg)
+            if len(arg) > budget:
+                arg = arg[:max(budget, 0)] + "..."
+            budget -= len(arg)
+            compact.append(arg)
+        return tuple(compact)
+
+    def __len__(self) -> int:
+        return min(self.next, self.capacity)
+
+    def query(self, name: Optional[str] = None, level: Optional[int] = None,
+              request_id: Optional[str] = None, since: Optional[int] = None,
+              until: Optional[int] = None, limit: int = 200) -> List[Dict[str, Any]]:
+        """
+        Return matching records, newest first.
+
+        name matches the logger name or any of its children ("A" matches
+        "A:b"). level keeps records at that level or more severe. since and
+        until are millisecond timestamps. request_id is matched against
+        the formatted content. Safe to call from a worker thread.
+        """
+        results = []
+        end = self.next
+        start = max(0, end - self.capacity)
+        for index in range(end - 1, start - 1, -1):
+            entry = self.slots[index % self.capacity]
+            if entry is None or entry[0] < index:
+                # 槽位已预留但记录尚未写入
+                continue
+            if entry[0] > index:
+                # 查询期间该槽位已被新记录覆盖，更早的记录都已不在
+                break
+            _, record_id, timestamp, record_level, type_name, record_name, args = entry
+            if until is not None and timestamp > until:
+                continue
+            if since is not None and timestamp < since:
+                # 记录按时间顺序写入，更早的记录无需再看
+                break
+            if level is not None and record_level > level:
+                continue
+            if name is not None and record_name != name and not record_name.startswith(name + ":"):
+                continue
+            content = Logger.get(record_name)._format(self.format_target, *args)
+            if request_id is not None and request_id not in content:
+                continue
+            results.append({
+                "id": record_id,
+                "timestamp": timestamp,
+                "type": type_name,
+                "level": record_level,
+                "name": record_name,
+                "content": content
+            })
+            if len(results) >= limit:
+                break
+        return results
@@ -11,6 +11,8 @@ import json
 import time
 import datetime
 import sys
+import threading
+from collections import deque
 from typing import Any, Callable, Dict, List, Optional, Union
 
 # 颜色代码数组（16色和256色）
@@ -168,6 +170,41 @@ class Time:
     def to_digits(source: Union[int, str], length: int = 2) -> str:
         return str(source).zfill(length)
 
+    # 模板标记，按最长优先匹配
+    _template_tokens = re.compile(r"yyyy|yy|MM|dd|hh|mm|ss|SSS")
+    _template_fields = {
+        "yyyy": "{0.year}",
+        "yy": "{1:02d}",
+        "MM": "{0.month:02d}",
+        "dd": "{0.day:02d}",
+        "hh": "{0.hour:02d}",
+        "mm": "{0.minute:02d}",
+        "ss": "{0.second:02d}",
+        "SSS": "{2:03d}"
+    }
+    _compiled_templates: Dict[str, Callable[[datetime.datetime], str]] = {}
+
+    @staticmethod
+    def compile_template(template_str: str) -> Callable[[datetime.datetime], str]:
+        """将模板编译为格式化函数（结果缓存），避免每次逐个 replace"""
+        formatter = Time._compiled_templates.get(template_str)
+        if formatter is None:
+            parts = []
+            last = 0
+            for match in Time._template_tokens.finditer(template_str):
+                literal = template_str[last:match.start()]
+                parts.append(literal.replace("{", "{{").replace("}", "}}"))
+                parts.append(Time._template_fields[match.group(0)])
+                last = match.end()
+            parts.append(template_str[last:].replace("{", "{{").replace("}", "}}"))
+            fmt = "".join(parts)
+
+            def formatter(dt: datetime.datetime) -> str:
+                return fmt.format(dt, dt.year % 100, dt.microsecond // 1000)
+
+            Time._compiled_templates[template_str] = formatter
+        return formatter
+
     @staticmethod
     def template(template_str: str, dt: Optional[datetime.datetime] = None) -> str:
         """
@@ -176,20 +213,7 @@ class Time:
         """
         if dt is None:
             dt = datetime.datetime.now()
-        replacements = {
-            "yyyy": str(dt.year),
-            "yy": str(dt.year)[-2:],
-            "MM": Time.to_digits(dt.month),
-            "dd": Time.to_digits(dt.day),
-            "hh": Time.to_digits(dt.hour),
-            "mm": Time.to_digits(dt.minute),
-            "ss": Time.to_digits(dt.second),
-            "SSS": Time.to_digits(dt.microsecond // 1000, 3)
-        }
-        res = template_str
-        for k, v in replacements.items():
-            res = res.replace(k, v)
-        return res
+        return Time.compile_template(template_str)(dt)
 
 
 # ------------------------------------
@@ -201,7 +225,271 @@ LogFunction = Callable[..., None]
 Formatter = Callable[[Any, Dict[str, Any], "Logger"], Any]
 LabelStyle = Dict[str, Any]
 Record = Dict[str, Any]
-Target = Dict[str, Any]  # 存放配置，如：colors、showTime、label、record、print、levels、timestamp 等
+
+# 格式标记，如 %s、%d、%j
+_FORMAT_PATTERN = re.compile(r'%([a-zA-Z%])')
+Target = Dict[str, Any]  # 存放配置，如：colors、showTime、label、record、print、raw、levels、timestamp 等
+
+# ------------------------------------
+# LogQueue 类
+# ------------------------------------
+class LogQueue:
+    """
+    有界环形缓冲区 + 后台写线程。
+    调用方只追加一条紧凑记录；格式化、渲染与输出都在后台线程中批量完成。
+    缓冲区满时的策略：
+      "drop"  丢弃新记录并计数；
+      "block" 阻塞调用方直到有空位，并记录阻塞次数。
+    """
+
+    def __init__(self, capacity: int = 8192, policy: str = "drop",
+                 batch_size: int = 256, flush_interval: float = 0.05):
+        if policy not in ("drop", "block"):
+            raise ValueError(f"Unknown log queue policy: {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer: deque = deque()
+        self.lock = threading.Lock()
+        self.not_empty = threading.Event()
+        self.not_full = threading.Condition(self.lock)
+        self.dropped = 0
+        self.blocked = 0
+        self.written = 0
+        # 输出目标抛出异常的批次数和其中的记录数；写线程捕获后继续运行
+        self.errors = 0
+        self.failed = 0
+        self.last_error: Optional[str] = None
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="LogQueue", daemon=True)
+        self.thread.start()
+
+    def put(self, item: tuple) -> bool:
+        if len(self.buffer) >= self.capacity:
+            if self.policy == "drop":
+                self.dropped += 1
+                return False
+            with self.not_full:
+                self.blocked += 1
+                while len(self.buffer) >= self.capacity and self.running:
+                    self.not_full.wait()
+        self.buffer.append(item)
+        if not self.not_empty.is_set():
+            self.not_empty.set()
+        return True
+
+    def _drain(self) -> List[tuple]:
+        batch = []
+        buffer = self.buffer
+        while buffer and len(batch) < self.batch_size:
+            batch.append(buffer.popleft())
+        if self.policy == "block" and batch:
+            with self.not_full:
+                self.not_full.notify_all()
+        return batch
+
+    def _run(self) -> None:
+        reported = 0
+        reported_errors = 0
+        last_error_report = 0.0
+        while self.running or self.buffer:
+            self.not_empty.wait(self.flush_interval)
+            self.not_empty.clear()
+            while True:
+                batch = self._drain()
+                if not batch:
+                    break
+                if self._flush(batch):
+                    self.written += len(batch)
+            if self.dropped != reported:
+                self._flush([(
+                    Logger.get("Logger"), "warn", Logger.WARN,
+                    (f"log queue full, dropped {self.dropped - reported} records",),
+                    int(time.time() * 1000), Logger.id
+                )])
+                reported = self.dropped
+            now = time.monotonic()
+            if self.errors != reported_errors and now - last_error_report >= Logger.sampling_summary_interval:
+                # 出错的可能正是日志目标本身，汇总直接写到 stderr
+                try:
+                    sys.stderr.write(
+                        f"LogQueue: {self.errors - reported_errors} log batches failed "
+                        f"({self.failed} records lost in total), last error: {self.last_error}\n"
+                    )
+                except Exception:
+                    pass
+                reported_errors = self.errors
+                last_error_report = now
+
+    def _flush(self, batch: List[tuple]) -> bool:
+        """Write one batch; a failing target costs that batch, never the writer thread"""
+        try:
+            Logger._write_batch(batch)
+            return True
+        except Exception as e:
+            self.errors += 1
+            self.failed += len(batch)
+            self.last_error = repr(e)
+            return False
+
+    def stop(self, timeout: float = 5) -> None:
+        self.running = False
+        self.not_empty.set()
+        with self.not_full:
+            self.not_full.notify_all()
+        self.thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self.buffer),
+            "written": self.written,
+            "dropped": self.dropped,
+            "blocked": self.blocked,
+            "errors": self.errors,
+            "failed": self.failed
+        }
+
+
+class LevelConfig(dict):
+    """
+    可观察的级别配置字典：任何修改（包括嵌套字典）都会递增 version，
+    Logger 据此清空按 (名称, 目标) 缓存的有效级别。
+    """
+    version = 0
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        for key, value in dict.items(self):
+            if isinstance(value, dict) and not isinstance(value, LevelConfig):
+                dict.__setitem__(self, key, LevelConfig(value))
+
+    @classmethod
+    def _changed(cls) -> None:
+        LevelConfig.version += 1
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if isinstance(value, dict) and not isinstance(value, LevelConfig):
+            value = LevelConfig(value)
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key: str) -> None:
+        super().__delitem__(key)
+        self._changed()
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, *args: Any) -> Any:
+        value = super().pop(*args)
+        self._changed()
+        return value
+
+    def popitem(self) -> Any:
+        item = super().popitem()
+        self._changed()
+        return item
+
+    def clear(self) -> None:
+        super().clear()
+        self._changed()
+
+
+class TargetList(list):
+    """
+    Logger.targets 列表：增删目标时递增 LevelConfig.version，
+    使各 Logger 缓存的启用阈值失效。
+    """
+
+    def append(self, target: Target) -> None:
+        super().append(target)
+        LevelConfig._changed()
+
+    def extend(self, targets: Any) -> None:
+        super().extend(targets)
+        LevelConfig._changed()
+
+    def insert(self, index: Any, target: Target) -> None:
+        super().insert(index, target)
+        LevelConfig._changed()
+
+    def remove(self, target: Target) -> None:
+        super().remove(target)
+        LevelConfig._changed()
+
+    def pop(self, index: Any = -1) -> Target:
+        target = super().pop(index)
+        LevelConfig._changed()
+        return target
+
+    def clear(self) -> None:
+        super().clear()
+        LevelConfig._changed()
+
+    def __setitem__(self, index: Any, value: Any) -> None:
+        super().__setitem__(index, value)
+        LevelConfig._changed()
+
+    def __delitem__(self, index: Any) -> None:
+        super().__delitem__(index)
+        LevelConfig._changed()
+
+    def __iadd__(self, targets: Any) -> "TargetList":
+        super().__iadd__(targets)
+        LevelConfig._changed()
+        return self
+
+
+class CallSite:
+    """单个日志调用点的采样与令牌桶状态"""
+    __slots__ = ("rule", "location", "logger", "type_name", "level",
+                 "count", "tokens", "updated", "suppressed", "last_summary")
+
+    def __init__(self, rule: Dict[str, float], location: str, now: float,
+                 logger: "Logger", type_name: str, level: int):
+        self.rule = rule
+        self.location = location
+        # 汇总记录以该调用点首次记录时的 Logger 和级别输出
+        self.logger = logger
+        self.type_name = type_name
+        self.level = level
+        self.count = 0
+        self.tokens = float(rule.get("burst", rule.get("rate", 0)))
+        self.updated = now
+        self.suppressed = 0
+        self.last_summary = now
+
+    def allow(self, now: float) -> bool:
+        rule = self.rule
+        self.count += 1
+        sample = rule.get("sample")
+        if sample and sample > 1 and self.count % sample != 1:
+            self.suppressed += 1
+            return False
+        rate = rule.get("rate")
+        if rate:
+            burst = rule.get("burst", rate)
+            self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+            self.updated = now
+            if self.tokens < 1:
+                self.suppressed += 1
+                return False
+            self.tokens -= 1
+        return True
+
+    def summarize(self, now: float) -> None:
+        self.logger._write(self.type_name, self.level,
+                           (f"suppressed {self.suppressed} similar records ({self.location})",))
+        self.suppressed = 0
+        self.last_summary = now
+
 
 def is_aggregate_error(error: Exception) -> bool:
     # Python 中可自定义聚合异常，可扩展此判断
@@ -219,24 +507,80 @@ class Logger:
 
     # 全局配置
     id = 0  # 自增 id
-    targets: List[Target] = []
+    targets: List[Target] = TargetList()
     formatters: Dict[str, Formatter] = {}
-    levels: Level = {"base": 2}
+    levels: Level = LevelConfig({"base": 2})
+    queue: Optional[LogQueue] = None  # 非空时启用异步队列输出
+    # 按 Logger 名称和级别配置的调用点采样/限流规则，例如：
+    #   {"WebSocketManager": {"info": {"sample": 100}},
+    #    "StreamManager": {"info": {"rate": 50, "burst": 100}}}
+    # sample 表示每 N 条记录一条；rate/burst 为令牌桶（条/秒、桶容量）
+    sampling: Dict[str, Dict[str, Dict[str, float]]] = {}
+    # 被抑制记录的汇总输出间隔（秒）
+    sampling_summary_interval: float = 10
+
+    # _threshold：所有目标中最详细的启用级别，is_enabled 据此一次比较即可返回；
+    # 计算时的 LevelConfig.version、targets、levels 或任一目标的 levels 对象变化后重新计算
+    __slots__ = ("name", "meta", "_threshold", "_threshold_version", "_threshold_targets",
+                 "_threshold_levels", "_threshold_target_levels")
+
+    # 命名 Logger 缓存，见 Logger.get
+    _registry: Dict[str, "Logger"] = {}
+    # (名称, id(目标), id(levels)) -> 有效级别；配置变化时整体清空
+    _level_cache: Dict[tuple, int] = {}
+    _level_state: tuple = ()
+    # 渲染缓存：颜色代码、带颜色的标签、同一毫秒内的时间前缀
+    _code_cache: Dict[tuple, int] = {}
+    _label_cache: Dict[tuple, tuple] = {}
+    _time_cache: Dict[tuple, tuple] = {}
+    # (代码对象, 行号, 级别名) -> CallSite
+    _sites: Dict[tuple, CallSite] = {}
 
     def __init__(self, name: str, meta: Any = None):
         self.name = name
         self.meta = meta
-        # 动态生成日志方法
-        self._create_method("success", Logger.SUCCESS)
-        self._create_method("error", Logger.ERROR)
-        self._create_method("info", Logger.INFO)
-        self._create_method("warn", Logger.WARN)
-        self._create_method("debug", Logger.DEBUG)
+        self._threshold = Logger.SILENT
+        self._threshold_version = -1
+        self._threshold_targets: Optional[List[Target]] = None
+        self._threshold_levels: Optional[Level] = None
+        self._threshold_target_levels: tuple = ()
+
+    @classmethod
+    def get(cls, name: str) -> "Logger":
+        """返回指定名称的缓存实例，适合在热路径（如每个请求）中使用"""
+        logger = cls._registry.get(name)
+        if logger is None:
+            logger = cls._registry[name] = cls(name)
+        return logger
 
     @classmethod
     def format_formatter(cls, name: str, formatter: Formatter) -> None:
         cls.formatters[name] = formatter
 
+    @classmethod
+    def start_queue(cls, capacity: int = 8192, policy: str = "drop",
+                    batch_size: int = 256, flush_interval: float = 0.05) -> LogQueue:
+        """启用异步队列模式：调用方只入队，后台线程负责渲染与批量输出"""
+        if cls.queue is None:
+            cls.queue = LogQueue(capacity, policy, batch_size, flush_interval)
+        return cls.queue
+
+    @classmethod
+    def stop_queue(cls) -> None:
+        """停止异步队列并输出剩余记录，之后恢复同步输出"""
+        queue, cls.queue = cls.queue, None
+        if queue is not None:
+            queue.stop()
+
+    @staticmethod
+    def _write_batch(batch: List[tuple]) -> None:
+        """在后台线程中渲染一批记录；同一 print 目标的多行合并为一次输出"""
+        lines: Dict[int, tuple] = {}
+        for logger, type_name, level, args, timestamp, record_id in batch:
+            logger._emit(type_name, level, args, timestamp, record_id, lines)
+        for target, chunk in lines.values():
+            target["print"]("\n".join(chunk))
+
     @staticmethod
     def color(target: Target, code: int, value: Any, decoration: str = "") -> str:
         # 若目标不支持颜色，则直接返回字符串
@@ -252,13 +596,39 @@ class Logger:
 
     @staticmethod
     def code(name: str, target: Target) -> int:
-        h = 0
-        for ch in name:
-            h = (h << 3) - h + ord(ch) + 13
-            # 模拟 JS 位运算（32位整数处理）
-            h = ((h + 2**31) % 2**32) - 2**31
-        colors_list = c256 if target.get("colors", 0) >= 2 else c16
-        return colors_list[abs(h) % len(colors_list)]
+        wide = target.get("colors", 0) >= 2
+        key = (name, wide)
+        code_val = Logger._code_cache.get(key)
+        if code_val is None:
+            h = 0
+            for ch in name:
+                h = (h << 3) - h + ord(ch) + 13
+                # 模拟 JS 位运算（32位整数处理）
+                h = ((h + 2**31) % 2**32) - 2**31
+            colors_list = c256 if wide else c16
+            code_val = Logger._code_cache[key] = colors_list[abs(h) % len(colors_list)]
+        return code_val
+
+    @staticmethod
+    def _label(name: str, target: Target) -> tuple:
+        """按 (名称, 颜色级别) 缓存颜色代码与带颜色的标签"""
+        key = (name, target.get("colors", 0))
+        cached = Logger._label_cache.get(key)
+        if cached is None:
+            code_val = Logger.code(name, target)
+            cached = Logger._label_cache[key] = (code_val, Logger.color(target, code_val, name, ";1"))
+        return cached
+
+    @staticmethod
+    def _time_prefix(target: Target, timestamp: int) -> tuple:
+        """渲染时间前缀；同一毫秒内的记录复用上一次的结果"""
+        key = (target["showTime"], target.get("colors", 0))
+        cached = Logger._time_cache.get(key)
+        if cached is None or cached[0] != timestamp:
+            dt = datetime.datetime.fromtimestamp(timestamp / 1000)
+            tstr = Time.compile_template(target["showTime"])(dt)
+            cached = Logger._time_cache[key] = (timestamp, len(tstr), Logger.color(target, 8, tstr))
+        return cached[1], cached[2]
 
     @staticmethod
     def render(target: Target, record: Record) -> str:
@@ -269,12 +639,10 @@ class Logger:
         indent = 3 + len(space)
         output = ""
         if "showTime" in target and target["showTime"]:
-            dt = datetime.datetime.fromtimestamp(record["timestamp"] / 1000)
-            tstr = Time.template(target["showTime"], dt)
-            output += Logger.color(target, 8, tstr) + space
-            indent += len(tstr) + len(space)
-        code_val = Logger.code(record["name"], target)
-        label = Logger.color(target, code_val, record["name"], ";1")
+            tlen, colored = Logger._time_prefix(target, record["timestamp"])
+            output += colored + space
+            indent += tlen + len(space)
+        code_val, label = Logger._label(record["name"], target)
         pad_width = label_style.get("width", 0)
         pad_length = pad_width + len(label) - len(record["name"])
         if label_style.get("align") == "right":
@@ -282,7 +650,9 @@ class Logger:
             indent += pad_width + len(space)
         else:
             output += prefix + space + label.ljust(pad_length) + space
-        content = record["content"].replace("\n", "\n" + " " * indent)
+        content = record["content"]
+        if "\n" in content:
+            content = content.replace("\n", "\n" + " " * indent)
         output += content
         if target.get("showDiff") and target.get("timestamp") is not None:
             diff = record["timestamp"] - target["timestamp"]
@@ -292,42 +662,148 @@ class Logger:
     def extend(self, namespace: str) -> "Logger":
         return Logger(f"{self.name}:{namespace}", self.meta)
 
-    def _create_method(self, type_name: str, level: int) -> None:
+    def success(self, *args: Any) -> None:
+        if self.is_enabled(Logger.SUCCESS):
+            self._log("success", Logger.SUCCESS, args, sys._getframe(1) if Logger.sampling else None)
+
+    def error(self, *args: Any) -> None:
+        if self.is_enabled(Logger.ERROR):
+            self._log("error", Logger.ERROR, args, sys._getframe(1) if Logger.sampling else None)
+
+    def info(self, *args: Any) -> None:
+        if self.is_enabled(Logger.INFO):
+            self._log("info", Logger.INFO, args, sys._getframe(1) if Logger.sampling else None)
+
+    def warn(self, *args: Any) -> None:
+        if self.is_enabled(Logger.WARN):
+            self._log("warn", Logger.WARN, args, sys._getframe(1) if Logger.sampling else None)
+
+    def debug(self, *args: Any) -> None:
+        if self.is_enabled(Logger.DEBUG):
+            self._log("debug", Logger.DEBUG, args, sys._getframe(1) if Logger.sampling else None)
+
+    def is_enabled(self, level: int) -> bool:
+        """是否至少有一个输出目标启用了该级别；用于在热路径上跳过参数构造"""
+        if (self._threshold_version != LevelConfig.version
+                or self._threshold_targets is not Logger.targets
+                or self._threshold_levels is not Logger.levels):
+            self._update_threshold()
+        else:
+            # 目标是普通字典，target["levels"] = {...} 整体替换无法通知，按对象身份比较
+            for target, levels in self._threshold_target_levels:
+                if target.get("levels") is not levels:
+                    self._update_threshold()
+                    break
+        return level <= self._threshold
+
+    def _update_threshold(self) -> None:
+        threshold = Logger.SILENT
+        for target in Logger.targets:
+            threshold = max(threshold, self.get_level(target))
+        # get_level 可能把普通字典形式的 Logger.levels 替换为 LevelConfig，需在其后记录
+        self._threshold = threshold
+        self._threshold_version = LevelConfig.version
+        self._threshold_targets = Logger.targets
+        self._threshold_levels = Logger.levels
+        self._threshold_target_levels = tuple((target, target.get("levels")) for target in Logger.targets)
+
+    def _log(self, type_name: str, level: int, args: tuple, caller: Any = None) -> None:
+        """
+        日志方法的公共实现，如 logger.error(...), logger.info(...) 等。
+        支持 %-风格的延迟参数，如 logger.info("Sent %s", request_id)。
+        公共方法先检查 is_enabled，级别未启用时不会进行任何格式化；
+        caller 为公共方法捕获的调用方帧（仅在配置了采样时），递归输出异常链时原样传递。
+        """
+        if len(args) == 1 and isinstance(args[0], Exception):
+            err = args[0]
+            if getattr(err, "__cause__", None):
+                self._log(type_name, level, (err.__cause__,), caller)
+                return
+            elif is_aggregate_error(err):
+                for e in getattr(err, "errors"):
+                    self._log(type_name, level, (e,), caller)
+                return
+
+        if caller is not None:
+            rules = Logger.sampling.get(self.name)
+            if rules and type_name in rules and not self._sampled(type_name, level, rules[type_name], caller):
+                return
+        self._write(type_name, level, args)
+
+    def _sampled(self, type_name: str, level: int, rule: Dict[str, float], frame: Any) -> bool:
+        """
+        按调用点（frame 为调用方帧）应用采样和令牌桶限流；返回 False 表示丢弃该记录。
+        每个汇总间隔内输出一次 "suppressed N similar records"。
+        """
+        key = (frame.f_code, frame.f_lineno, type_name)
+        now = time.monotonic()
+        site = Logger._sites.get(key)
+        if site is None or site.rule is not rule:
+            location = f"{frame.f_code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno}"
+            site = Logger._sites[key] = CallSite(rule, location, now, self, type_name, level)
+        allowed = site.allow(now)
+        if site.suppressed and now - site.last_summary >= Logger.sampling_summary_interval:
+            site.summarize(now)
+        return allowed
+
+    @classmethod
+    def flush_summaries(cls, force: bool = False) -> None:
+        """
+        输出所有到期的抑制汇总，使不再记录的调用点也能看到被抑制的条数。
+        由定时任务周期调用；force 为 True 时忽略汇总间隔（如关闭前）。
+        """
+        now = time.monotonic()
+        for site in list(cls._sites.values()):
+            if site.suppressed and (force or now - site.last_summary >= cls.sampling_summary_interval):
+                site.summarize(now)
+
+    def _write(self, type_name: str, level: int, args: tuple) -> None:
+        Logger.id += 1
+        timestamp = int(time.time() * 1000)
+        # raw 目标直接保存未格式化的参数（同步、低开销），其余目标再走队列或同步输出
+        pending = False
+        for target in Logger.targets:
+            if self.get_level(target) < level:
+                continue
+            raw = target.get("raw")
+            if raw is not None:
+                raw(Logger.id, timestamp, level, type_name, self.name, args)
+            else:
+                pending = True
+        if not pending:
+            return
+        if Logger.queue is not None:
+            Logger.queue.put((self, type_name, level, args, timestamp, Logger.id))
+            return
+        self._emit(type_name, level, args, timestamp, Logger.id)
+
+    def _emit(self, type_name: str, level: int, args: tuple, timestamp: int,
+              record_id: int, lines: Optional[Dict[int, tuple]] = None) -> None:
         """
-        动态定义日志方法，如 logger.error(...), logger.info(...) 等。
+        将一条记录输出到所有启用该级别的目标。
+        传入 lines 时，print 目标的渲染结果先收集起来，由调用方批量输出。
         """
-        def log_method(*args: Any) -> None:
-            if len(args) == 1 and isinstance(args[0], Exception):
-                err = args[0]
-                if getattr(err, "__cause__", None):
-                    getattr(self, type_name)(err.__cause__)
-                    return
-                elif is_aggregate_error(err):
-                    for e in getattr(err, "errors"):
-                        getattr(self, type_name)(e)
-                    return
-
-            Logger.id += 1
-            timestamp = int(time.time() * 1000)
-            for target in Logger.targets:
-                if self.get_level(target) < level:
-                    continue
-                content = self._format(target, *args)
-                record: Record = {
-                    "id": Logger.id,
-                    "type": type_name,
-                    "level": level,
-                    "name": self.name,
-                    "meta": self.meta,
-                    "content": content,
-                    "timestamp": timestamp
-                }
-                if callable(target.get("record")):
-                    target["record"](record)
-                elif callable(target.get("print")):
+        for target in Logger.targets:
+            if "raw" in target or self.get_level(target) < level:
+                continue
+            content = self._format(target, *args)
+            record: Record = {
+                "id": record_id,
+                "type": type_name,
+                "level": level,
+                "name": self.name,
+                "meta": self.meta,
+                "content": content,
+                "timestamp": timestamp
+            }
+            if callable(target.get("record")):
+                target["record"](record)
+            elif callable(target.get("print")):
+                if lines is None:
                     target["print"](Logger.render(target, record))
-                target["timestamp"] = timestamp
-        setattr(self, type_name, log_method)
+                else:
+                    lines.setdefault(id(target), (target, []))[1].append(Logger.render(target, record))
+            target["timestamp"] = timestamp
 
     def _format(self, target: Target, *args: Any) -> str:
         """
@@ -347,28 +823,59 @@ class Logger:
         else:
             fmt = args.pop(0)
 
-        def repl(match: re.Match) -> str:
-            spec = match.group(1)
-            if spec == "%":
-                return "%"
-            if spec in Logger.formatters and callable(Logger.formatters[spec]) and args:
-                val = args.pop(0)
-                return str(Logger.formatters[spec](val, target, self))
-            return match.group(0)
-        
-        fmt = re.sub(r'%([a-zA-Z%])', repl, fmt)
+        if "%" in fmt:
+            def repl(match: re.Match) -> str:
+                spec = match.group(1)
+                if spec == "%":
+                    return "%"
+                if spec in Logger.formatters and callable(Logger.formatters[spec]) and args:
+                    val = args.pop(0)
+                    return str(Logger.formatters[spec](val, target, self))
+                return match.group(0)
+
+            fmt = _FORMAT_PATTERN.sub(repl, fmt)
         max_length = target.get("maxLength", 10240)
         lines = fmt.splitlines()
         lines = [line[:max_length] + ("..." if len(line) > max_length else "") for line in lines]
         return "\n".join(lines)
 
+    @classmethod
+    def clear_level_cache(cls) -> None:
+        """手动清空有效级别缓存（直接替换普通字典形式的配置后可调用）"""
+        cls._level_cache.clear()
+        cls._level_state = ()
+        LevelConfig._changed()
+
     def get_level(self, target: Target) -> int:
         """
         根据 Logger 的名称层次（用冒号分隔）以及目标 target 的 levels 配置，
         返回对应的日志级别，若没有配置则返回默认级别。
+        结果按 (名称, 目标) 缓存，Logger.levels 或目标 levels 变化时失效。
         """
+        levels = target.get("levels", Logger.levels)
+        state = (LevelConfig.version, id(Logger.levels))
+        if Logger._level_state != state:
+            Logger._level_cache.clear()
+            Logger._level_state = state
+        key = (self.name, id(target), id(levels))
+        level = Logger._level_cache.get(key)
+        if level is None:
+            if isinstance(levels, dict) and not isinstance(levels, LevelConfig):
+                # 将普通字典替换为可观察版本，之后的原地修改会使缓存失效
+                levels = LevelConfig(levels)
+                if "levels" in target:
+                    target["levels"] = levels
+                else:
+                    Logger.levels = levels
+                    Logger._level_state = (LevelConfig.version, id(levels))
+                key = (self.name, id(target), id(levels))
+            level = self._resolve_level(levels)
+            Logger._level_cache[key] = level
+        return level
+
+    def _resolve_level(self, levels: Union[Level, Dict[str, Any]]) -> int:
         paths = self.name.split(":")
-        config: Union[Level, Dict[str, Any]] = target.get("levels", Logger.levels)
+        config: Union[Level, Dict[str, Any]] = levels
         while paths and isinstance(config, dict):
             key = paths.pop(0)
             if key in config:
@@ -1,26 +1,84 @@
 import asyncio
+import hmac
+import math
+import os
 import uuid
 import time
 from logger import Logger
-from fastapi import FastAPI, HTTPException, Header, BackgroundTasks
-from fastapi.responses import JSONResponse
-from typing import Dict
+from file_target import FileTarget
+from log_ring import LogRing
+from access_log import AccessLogMiddleware
+from admission import AdmissionController, AdmissionMiddleware, LoopLagMonitor
+from fastapi import FastAPI, HTTPException, Header, BackgroundTasks, Depends, Request
+from fastapi.responses import JSONResponse, Response
+from typing import Dict, Optional
 from websocket_manager import WebSocketManager
 from request_manager import RequestManager
-from stream_manager import StreamManager
-from authentication_manager import AuthenticationManager
+from stream_manager import StreamManager, STREAM_CONFIG
+from authentication_manager import AuthenticationManager, AUTH_CONFIG
+from auth_store import AuthStore
 from contextlib import asynccontextmanager
 from models import ChatCompletionRequest
+from response_cache import cache_policy
+from disk_cache import DiskCache, DISK_CACHE_CONFIG
+import metrics
+import tracing
 import time
 import logging
 import uvicorn
 
+# 日志配置：queued 为 True 时日志在后台线程中渲染和输出，不阻塞事件循环
+LOG_CONFIG = {
+    'queued': True,
+    'capacity': 8192,
+    # 缓冲区满时的策略："drop" 丢弃并计数，"block" 阻塞调用方
+    'policy': 'drop',
+    # 日志文件路径，None 表示不写文件；format 为 "plain" 或 "json"（JSON Lines）
+    'file': None,
+    'file_format': 'plain',
+    'file_max_bytes': 256 * 1024 * 1024,
+    'file_rotate_interval': 24 * 3600,
+    'file_backups': 10,
+    # 热路径日志的调用点采样/限流，例如 {"WebSocketManager": {"info": {"sample": 100}}}
+    'sampling': {},
+    'sampling_summary_interval': 10,
+    # 内存环形日志缓冲（供 /admin/logs 查询），0 表示关闭；每条记录最多保留 ring_record_chars 个字符
+    # ring_level 为环形缓冲自己的级别；设为 DEBUG 会让所有 debug 调用点都需要构造记录
+    'ring_capacity': 65536,
+    'ring_level': Logger.INFO,
+    'ring_record_chars': 512
+}
+
+# 管理接口配置：/admin/logs 需要 Bearer 令牌（环境变量 HUSKY_ADMIN_TOKEN），未设置令牌时只允许本机访问
+ADMIN_CONFIG = {
+    'token': os.environ.get('HUSKY_ADMIN_TOKEN'),
+    'local_hosts': ("127.0.0.1", "::1")
+}
+
 # 配置请求日志
 logger = Logger("FastAPI")
 logger.targets.append({
     "colors": 1,
     "print": print
 })
+Logger.sampling = LOG_CONFIG['sampling']
+Logger.sampling_summary_interval = LOG_CONFIG['sampling_summary_interval']
+file_target = None
+if LOG_CONFIG['file']:
+    file_target = FileTarget(
+        LOG_CONFIG['file'],
+        format=LOG_CONFIG['file_format'],
+        max_bytes=LOG_CONFIG['file_max_bytes'],
+        rotate_interval=LOG_CONFIG['file_rotate_interval'],
+        backups=LOG_CONFIG['file_backups']
+    )
+    logger.targets.append(file_target.target())
+log_ring = None
+if LOG_CONFIG['ring_capacity']:
+    log_ring = LogRing(LOG_CONFIG['ring_capacity'], LOG_CONFIG['ring_level'], LOG_CONFIG['ring_record_chars'])
+    logger.targets.append(log_ring.target())
+if LOG_CONFIG['queued']:
+    Logger.start_queue(LOG_CONFIG['capacity'], LOG_CONFIG['policy'])
 
 class Handler(logging.Handler):
     def __init__(self, name: str):
@@ -56,14 +114,30 @@ uvicorn_logger.handlers = [uvicorn_handler]
 WS_CONFIG = {
     'timeout': 10,
     'reconnect_delay': 3,
-    'max_retries': 5
+    'max_retries': 5,
+    'pool_size': 4
 }
 
 # 创建全局实例
-ws_manager = WebSocketManager("wss://api.husky.gg/api")
-stream_manager = StreamManager(ws_manager)
-request_manager = RequestManager(ws_manager)
-auth_manager = AuthenticationManager(ws_manager)
+ws_manager = WebSocketManager("wss://api.husky.gg/api", pool_size=WS_CONFIG['pool_size'])
+disk_cache = DiskCache(DISK_CACHE_CONFIG['path']) if DISK_CACHE_CONFIG['path'] else None
+stream_manager = StreamManager(ws_manager, disk_cache=disk_cache)
+request_manager = RequestManager(ws_manager, disk_cache=disk_cache)
+auth_store = AuthStore(AUTH_CONFIG['store_path']) if AUTH_CONFIG['store_path'] else None
+auth_manager = AuthenticationManager(ws_manager, store=auth_store)
+loop_monitor = LoopLagMonitor()
+admission = AdmissionController(loop_monitor)
+
+# 抓取 /metrics 时才读取的注册表和队列大小
+metrics.OPEN.set_function(lambda: len(ws_manager.listeners), "listeners")
+metrics.OPEN.set_function(lambda: len(ws_manager.waiters), "waiters")
+metrics.OPEN.set_function(lambda: len(request_manager.queues) + len(stream_manager.queues), "queues")
+metrics.OPEN.set_function(lambda: len(stream_manager.stream_tasks), "stream_tasks")
+metrics.OPEN.set_function(lambda: len(request_manager.in_flight), "coalesced_in_flight")
+metrics.OPEN.set_function(lambda: admission.in_flight, "admitted")
+metrics.LOOP_LAG_SMOOTHED.set_function(lambda: loop_monitor.smoothed)
+for conn in ws_manager.pool:
+    metrics.UPSTREAM_GENERATION.set_function(lambda conn=conn: conn.generation, str(conn.index))
 
 # 存储流的队列，用于流式传输数据
 stream_queues: Dict[str, asyncio.Queue] = {}
@@ -93,6 +167,12 @@ MODELS_LIST = [
     for model, provider in MODEL_PROVIDER_MAP.items()
 ]
 
+async def flush_log_summaries() -> None:
+    """周期输出采样/限流的抑制汇总，调用点之后不再记录时汇总也不会滞留"""
+    while True:
+        await asyncio.sleep(max(1.0, Logger.sampling_summary_interval / 2))
+        Logger.flush_summaries()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
@@ -103,8 +183,12 @@ async def lifespan(app: FastAPI):
     # Startup
     try:
         logger.info("Starting application...")
+        tracing.configure(tracing.TRACE_CONFIG['otlp_file'])
+        loop_monitor.start()
+        summary_task = asyncio.create_task(flush_log_summaries())
         await ws_manager.connect()
         await ws_manager.start_listening()  # Start the message listener
+        await auth_manager.start_persistence()  # 后台重新认证最近使用过的钱包
         logger.info("Application started successfully")
     except Exception as e:
         logger.error("Failed to start application", e)
@@ -115,33 +199,29 @@ async def lifespan(app: FastAPI):
     # Shutdown
     try:
         logger.info("Shutting down application...")
+        summary_task.cancel()
+        await loop_monitor.stop()
+        await auth_manager.close()
         await ws_manager.close()
+        if disk_cache is not None:
+            disk_cache.close()
         logger.info("Application shutdown completed")
     except Exception as e:
         logger.error("Error during shutdown", e)
+    finally:
+        Logger.flush_summaries(force=True)
+        Logger.stop_queue()
+        if file_target is not None:
+            file_target.close()
+        tracing.close()
 
 # FastAPI 应用实例
 app = FastAPI(lifespan=lifespan)
-@app.middleware("http")
-async def log_requests(request, call_next):
-    start_time = time.time()
-    method =  request.method,
-    path = request.url.path,
-    client = request.client.host if request.client else "unknown"
-    port = request.client.port if request.client else "unknown"
-
-    logger.info(f"{method[0]} {client}:{port} {path[0]}")
-    
-    response = await call_next(request)
-    
-    # 记录响应信息
-    process_time = time.time() - start_time
-    status_code = response.status_code,
-    process_time = f"{process_time:.4f}s"
+# 准入控制：事件循环延迟或并发请求数超过阈值时，在解析请求体前直接返回 503/429
+app.add_middleware(AdmissionMiddleware, controller=admission)
 
-    logger.info(f"{method[0]} {client}:{port} {path[0]} {status_code[0]} {process_time}")
-    
-    return response
+# 访问日志（纯 ASGI 中间件，不缓冲响应体，记录总耗时、首字节时间、字节数与 SSE 事件数）
+app.add_middleware(AccessLogMiddleware, logger=logger)
 
 # 从 Authorization 头中提取 Bearer 令牌
 def get_bearer_token(authorization: str = Header(...)):
@@ -149,15 +229,39 @@ def get_bearer_token(authorization: str = Header(...)):
         raise HTTPException(status_code=401, detail="Invalid or missing Authorization header")
     return authorization.split("Bearer ")[1].strip()
 
+# 管理接口鉴权：配置了令牌时校验 Bearer 令牌，否则只允许本机访问
+def require_admin(request: Request, authorization: Optional[str] = Header(None)):
+    token = ADMIN_CONFIG['token']
+    if token:
+        supplied = authorization[len("Bearer "):].strip() if authorization and authorization.startswith("Bearer ") else ""
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            raise HTTPException(status_code=401, detail="Invalid admin token")
+    elif request.client is None or request.client.host not in ADMIN_CONFIG['local_hosts']:
+        raise HTTPException(status_code=403, detail="Admin endpoint is only available from localhost")
+
+# 解析 X-Stream-Coalesce 头：合并窗口（毫秒），"off" 或 0 表示关闭，超过 max_coalesce_window 时按上限处理
+def get_coalesce_window(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    if value.strip().lower() == "off":
+        return 0
+    try:
+        window = float(value)
+    except ValueError:
+        window = math.nan
+    if math.isnan(window):
+        raise HTTPException(status_code=400, detail="Invalid X-Stream-Coalesce header")
+    return min(max(window, 0) / 1000, STREAM_CONFIG['max_coalesce_window'])
+
 # FastAPI 端点处理 chat/completions 请求，动态认证
 @app.post("/v1/chat/completions")
-async def chat_completions(request: ChatCompletionRequest, background_tasks: BackgroundTasks, authorization: str = Header(...)):
-    logger = Logger("ChatCompletions")
+async def chat_completions(request: ChatCompletionRequest, background_tasks: BackgroundTasks, authorization: str = Header(...), x_stream_coalesce: Optional[str] = Header(None), cache_control: Optional[str] = Header(None)):
+    logger = Logger.get("ChatCompletions")
     request_id = str(uuid.uuid4())
     history_id = str(uuid.uuid4())
 
-    logger.info(f"Received chat completion request with ID: {request_id}")
-    logger.debug(f"Request details: {request.messages}")
+    logger.info("Received chat completion request with ID: %s", request_id)
+    logger.debug("Request details: %s", request.messages)
 
     # 获取 walletAddress 从 Authorization 头中提取
     wallet_address = get_bearer_token(authorization)
@@ -165,18 +269,27 @@ async def chat_completions(request: ChatCompletionRequest, background_tasks: Bac
         logger.error("Missing wallet address in Authorization header")
         raise HTTPException(status_code=401, detail="Missing wallet address in Authorization header")
 
-    logger.info(f"Authenticated wallet address: {wallet_address[:6]}...{wallet_address[-4:]}")
-
-    # 动态认证
-    if not await auth_manager.authenticate_wallet(wallet_address):
-        raise HTTPException(status_code=403, detail="Wallet authentication failed")
+    logger.info("Authenticated wallet address: %s...%s", wallet_address[:6], wallet_address[-4:])
 
-    # 从模型映射中获取 provider
+    # 从模型映射中获取 provider（先校验请求，无效请求不必发起认证）
     provider = MODEL_PROVIDER_MAP.get(request.model)
     if not provider:
         raise HTTPException(status_code=400, detail="Unsupported model")
+    coalesce_window = get_coalesce_window(x_stream_coalesce)
+    cache_lookup, cache_store = cache_policy(cache_control)
+
+    # 按阶段计时：非流式响应通过 Server-Timing 头返回，流式请求在流结束时输出追踪记录
+    trace = tracing.begin(request_id, model=request.model, provider=provider, stream=request.stream)
+
+    # 动态认证：先发起认证，在等待认证响应的同时构建请求体
+    tracing.start(request_id, "auth")
+    authentication = auth_manager.begin_authentication(wallet_address)
+    if not authentication.done():
+        # 让出一次事件循环，认证任务先把请求发出去；之后的构建是同步的，不让出就要等构建完才发送
+        await asyncio.sleep(0)
 
     # 构建消息体
+    tracing.start(request_id, "build")
     messages = [
         {
             "id": str(uuid.uuid4()),
@@ -199,19 +312,32 @@ async def chat_completions(request: ChatCompletionRequest, background_tasks: Bac
         },
         "requestId": request_id
     }
+    tracing.end(request_id, "build")
+
+    # 认证所在的上游会话（连接及其代数），补全请求必须从同一会话发出
+    session = await authentication
+    tracing.end(request_id, "auth")
+    if session is None:
+        tracing.finish(request_id, status=403)
+        raise HTTPException(status_code=403, detail="Wallet authentication failed")
 
     try:
         # 创建队列
         if request.stream:
             # 流式请求
-            return await stream_manager.handle_stream(request_id, completion_request, background_tasks)
+            return await stream_manager.handle_stream(request_id, completion_request, background_tasks, coalesce_window, cache_lookup, cache_store, session)
         else:
             # 非流式请求
-            return await request_manager.handle_request(request_id, completion_request, background_tasks)
+            response = await request_manager.handle_request(request_id, completion_request, background_tasks, cache_lookup, cache_store, session, wallet_address)
+            if trace is not None:
+                response.headers["Server-Timing"] = trace.server_timing()
+            tracing.finish(request_id, status=response.status_code)
+            return response
     except Exception as e:
         import traceback
         error_msg = f"Error in chat completions: {str(e)}\nTraceback:\n{traceback.format_exc()}"
         logger.error(error_msg)
+        tracing.finish(request_id, status=500, error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/v1/models")
@@ -223,6 +349,63 @@ async def get_models():
         }
     )
 
+# 上游连接池状态，用于评估连接池大小
+@app.get("/admin/pool")
+async def get_pool():
+    return JSONResponse(
+        content={
+            "pool_size": ws_manager.pool_size,
+            "connections": ws_manager.pool_stats()
+        }
+    )
+
+# 非流式请求统计（含合并的请求数）
+@app.get("/admin/requests")
+async def get_request_metrics():
+    return JSONResponse(content=request_manager.request_metrics())
+
+# 流式输出统计（含合并后的事件数下降比例）
+@app.get("/admin/streams")
+async def get_stream_metrics():
+    return JSONResponse(content=stream_manager.stream_metrics())
+
+# 钱包认证缓存与合并统计
+@app.get("/admin/auth")
+async def get_auth_metrics():
+    return JSONResponse(content=auth_manager.auth_metrics())
+
+# 准入控制与事件循环延迟
+@app.get("/admin/admission")
+async def get_admission():
+    return JSONResponse(content=admission.admission_stats())
+
+# Prometheus 文本格式指标
+@app.get("/metrics")
+async def get_metrics():
+    return Response(content=metrics.render_metrics(), media_type=metrics.CONTENT_TYPE)
+
+# 查询内存中的最近日志，level 可为级别名（error/info/debug）或数字，since/until 为毫秒时间戳
+# 日志包含请求内容和钱包地址片段，需要管理员令牌或本机访问
+@app.get("/admin/logs", dependencies=[Depends(require_admin)])
+async def get_logs(
+    name: Optional[str] = None,
+    level: Optional[str] = None,
+    request_id: Optional[str] = None,
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+    limit: int = 200
+):
+    if log_ring is None:
+        raise HTTPException(status_code=404, detail="Log ring buffer is disabled")
+    max_level = None
+    if level is not None:
+        max_level = int(level) if level.isdigit() else getattr(Logger, level.upper(), None)
+        if not isinstance(max_level, int):
+            raise HTTPException(status_code=400, detail=f"Unknown log level: {level}")
+    # 在线程中过滤和格式化，避免大范围查询占用事件循环
+    records = await asyncio.to_thread(log_ring.query, name, max_level, request_id, since, until, max(1, min(limit, 5000)))
+    return JSONResponse(content={"count": len(records), "records": records})
+
 if __name__ == "__main__":
     uvicorn.run(
         app,
@@ -1,8 +1,26 @@
 import asyncio
+import hashlib
+import codec
+import metrics
+import timing_wheel
 from typing import Dict, Optional
 from logger import Logger
+from websocket_manager import Session
 from fastapi import HTTPException
 
+def request_fingerprint(request: dict) -> str:
+    """Canonical hash of (model, messages) for a completion/getCompletion request
+
+    Per-request fields such as requestId, history_id and message ids are
+    left out, so identical prompts map to the same key.
+    """
+    args = request["args"]
+    canonical = codec.dumpb([
+        args["model"],
+        [[msg["role"], msg["content"]] for msg in args["messages"]]
+    ])
+    return hashlib.sha256(canonical).hexdigest()
+
 class BaseManager:
     def __init__(self, ws_manager):
         self.logger = Logger(self.__class__.__name__)
@@ -12,78 +30,49 @@ class BaseManager:
 
     async def create_queue(self, request_id: str) -> asyncio.Queue:
         """Create a queue and register it with WebSocketManager"""
-        self.logger.info(f"Creating queue for request_id: {request_id}")
+        self.logger.info("Creating queue for request_id: %s", request_id)
         queue = self.ws_manager.register_listener(request_id)
         self.queues[request_id] = queue
         return queue
 
     async def cleanup_queue(self, request_id: str):
         """Cleanup queue and unregister from WebSocketManager"""
-        self.logger.info(f"Cleaning up queue for request_id: {request_id}")
+        self.logger.info("Cleaning up queue for request_id: %s", request_id)
         self.ws_manager.unregister_listener(request_id)
         if request_id in self.queues:
             del self.queues[request_id]
 
-    async def wait_for_response(self, request_id: str, timeout: float) -> Optional[Dict]:
-        """Wait for a response with timeout"""
+    async def send_upstream(self, request_id: str, request: dict, session: Optional[Session] = None):
+        """Send a request upstream, pinned to the wallet's authenticated session when given"""
+        conn, generation = session if session is not None else (None, None)
+        if not await self.ws_manager.send(codec.dumps(request), request_id, conn, generation):
+            raise HTTPException(status_code=502, detail="Upstream connection unavailable")
+
+    def create_waiter(self, request_id: str) -> asyncio.Future:
+        """Create a one-shot response slot and register it with WebSocketManager"""
+        self.logger.info("Creating waiter for request_id: %s", request_id)
+        return self.ws_manager.register_waiter(request_id)
+
+    async def wait_for_response(self, request_id: str, waiter: asyncio.Future, timeout: float) -> Optional[Dict]:
+        """Wait on the waiter returned by create_waiter, with timeout
+
+        The router drops the waiter from ws_manager.waiters as soon as the
+        reply arrives (possibly while the send is still draining), so the
+        future must be kept by the caller rather than looked up again.
+        """
+        # The shared timing wheel fails the future on timeout; no extra tasks are needed
+        timer = timing_wheel.schedule(timeout, timing_wheel.expire, waiter)
         try:
-            # Get or create queue
-            queue = self.queues.get(request_id)
-            if not queue:
-                self.logger.error(f"Queue not found for request_id: {request_id}")
-                raise HTTPException(status_code=404, detail=f"Request not found: {request_id}")
+            response = await waiter
+        except asyncio.TimeoutError:
+            self.logger.error(f"Timeout waiting for response for request_id: {request_id}")
+            metrics.TIMEOUT_BY_TYPE["request"].inc()
+            raise HTTPException(status_code=408, detail=f"Request timeout: {request_id}")
+        finally:
+            timer.cancel()
+            self.ws_manager.unregister_waiter(request_id)
 
-            # Create a task to wait for the response
-            response_task = asyncio.create_task(queue.get())
-            
-            # Create a timeout task
-            timeout_task = asyncio.create_task(asyncio.sleep(timeout))
-            
-            # Wait for either the response or timeout
-            done, pending = await asyncio.wait(
-                [response_task, timeout_task],
-                return_when=asyncio.FIRST_COMPLETED
-            )
-            
-            try:
-                if response_task in done:
-                    # Response was received
-                    response = response_task.result()
-                    if response and response.get("code") == 200:
-                        return response
-                    else:
-                        error_msg = response.get("message", "Unknown error")
-                        raise HTTPException(status_code=500, detail=error_msg)
-                else:
-                    # Timeout occurred
-                    self.logger.error(f"Timeout waiting for response for request_id: {request_id}")
-                    raise HTTPException(status_code=408, detail=f"Request timeout: {request_id}")
-                    
-            finally:
-                # Cancel pending tasks
-                for task in pending:
-                    if not task.done():
-                        task.cancel()
-                        try:
-                            await task
-                        except asyncio.CancelledError:
-                            pass
-                        except Exception as e:
-                            self.logger.error(f"Error cancelling task: {str(e)}")
-                
-                # Cleanup queue
-                if request_id in self.queues:
-                    try:
-                        del self.queues[request_id]
-                    except Exception as e:
-                        self.logger.error(f"Error cleaning up queue: {str(e)}")
-                        
-        except Exception as e:
-            self.logger.error(f"Error waiting for response: {str(e)}")
-            # Cleanup queue on error
-            if request_id in self.queues:
-                try:
-                    del self.queues[request_id]
-                except Exception as cleanup_error:
-                    self.logger.error(f"Error during cleanup: {str(cleanup_error)}")
-            raise
+        if response and response.get("code") == 200:
+            return response
+        error_msg = response.get("message", "Unknown error") if response else "Unknown error"
+        raise HTTPException(status_code=500, detail=error_msg)
@@ -0,0 +1,193 @@
+"""
+In-process counters and histograms exposed in the Prometheus text format.
+
+Recording is a plain attribute or list-slot increment on an object resolved
+ahead of time, with no locks: every recorder runs on the event loop thread.
+Label children are created once per label set and cached on the family,
+so hot paths keep a reference to the child (or look it up in a dict) and
+then pay one increment. Gauges for queue and registry sizes are callbacks
+read only when /metrics is scraped.
+"""
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# 直方图默认桶（秒）
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+GAP_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # 最后一个桶为 +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+class MetricFamily:
+    """One metric name with its help text, label names and per-label-set children"""
+    def __init__(self, name: str, help: str, kind: str, labelnames: Sequence[str] = (), buckets: Tuple[float, ...] = ()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.children: Dict[Tuple[str, ...], object] = {}
+        REGISTRY.append(self)
+
+    def labels(self, *values: str):
+        """Child for a label set; resolve once and keep it on hot paths"""
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = Histogram(self.buckets) if self.kind == "histogram" else Counter()
+            self.children[values] = child
+        return child
+
+    def set_function(self, function: Callable[[], float], *values: str) -> None:
+        """Gauge child whose value is read from function() at scrape time"""
+        self.children[values] = function
+
+    def render(self, lines: List[str]) -> None:
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        for values, child in self.children.items():
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values))
+            if self.kind == "histogram":
+                prefix = labels + "," if labels else ""
+                cumulative = 0
+                for bound, count in zip(self.buckets, child.counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{prefix}le="{_number(bound)}"}} {cumulative}')
+                cumulative += child.counts[-1]
+                lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+                suffix = "{" + labels + "}" if labels else ""
+                lines.append(f"{self.name}_sum{suffix} {_number(child.sum)}")
+                lines.append(f"{self.name}_count{suffix} {cumulative}")
+            else:
+                value = child() if callable(child) else child.value
+                suffix = "{" + labels + "}" if labels else ""
+                lines.append(f"{self.name}{suffix} {_number(value)}")
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _number(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+REGISTRY: List[MetricFamily] = []
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> MetricFamily:
+    return MetricFamily(name, help, "counter", labelnames)
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> MetricFamily:
+    return MetricFamily(name, help, "histogram", labelnames, buckets)
+
+def gauge(name: str, help: str, labelnames: Sequence[str] = ()) -> MetricFamily:
+    return MetricFamily(name, help, "gauge", labelnames)
+
+def render_metrics() -> str:
+    """Text exposition format 0.0.4 for every registered family"""
+    lines: List[str] = []
+    for family in REGISTRY:
+        family.render(lines)
+    lines.append("")
+    return "\n".join(lines)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ------------------------------------
+# 代理指标
+# ------------------------------------
+REQUEST_LATENCY = histogram(
+    "husky_request_duration_seconds",
+    "Chat completion latency, until the full response or the end of the stream",
+    ("model", "provider", "stream")
+)
+TIME_TO_FIRST_TOKEN = histogram(
+    "husky_time_to_first_token_seconds",
+    "Time from sending a stream request upstream to its first chunk",
+    ("model", "provider")
+)
+INTER_TOKEN_GAP = histogram(
+    "husky_inter_token_gap_seconds",
+    "Time between consecutive upstream stream chunks",
+    buckets=GAP_BUCKETS
+).labels()
+TOKENS_PER_SECOND = histogram(
+    "husky_stream_tokens_per_second",
+    "Upstream chunks per second over a whole stream",
+    ("model", "provider"),
+    buckets=RATE_BUCKETS
+)
+UPSTREAM_RTT = histogram(
+    "husky_upstream_rtt_seconds",
+    "Time from sending a message upstream to the first message back for its request id"
+).labels()
+UPSTREAM_RECONNECTS = counter(
+    "husky_upstream_reconnects_total",
+    "Upstream WebSocket connections re-established after the first connect"
+).labels()
+UPSTREAM_GENERATION = gauge(
+    "husky_upstream_generation",
+    "Upstream connection generation, incremented on every (re)connect of that connection",
+    ("connection",)
+)
+UPSTREAM_CONNECT_FAILURES = counter(
+    "husky_upstream_connect_failures_total",
+    "Failed upstream WebSocket connect attempts"
+).labels()
+AUTH_CACHE = counter(
+    "husky_auth_cache_total",
+    "Wallet authentication lookups by result",
+    ("result",)
+)
+AUTH_CACHE_HITS = AUTH_CACHE.labels("hit")
+AUTH_CACHE_MISSES = AUTH_CACHE.labels("miss")
+TIMEOUTS = counter(
+    "husky_timeouts_total",
+    "Timeouts by type",
+    ("type",)
+)
+# 按 timeout 类型预先解析的子指标，类型名与 StreamManager 的 deadline kind 一致
+TIMEOUT_BY_TYPE = {
+    kind: TIMEOUTS.labels(kind)
+    for kind in ("request", "first-token", "inter-token", "auth")
+}
+LOOP_LAG = histogram(
+    "husky_event_loop_lag_seconds",
+    "Event loop scheduling delay, sampled by LoopLagMonitor",
+    buckets=GAP_BUCKETS
+).labels()
+LOOP_LAG_SMOOTHED = gauge(
+    "husky_event_loop_lag_smoothed_seconds",
+    "Exponentially smoothed event loop lag used for admission control"
+)
+ADMISSION_REJECTED = counter(
+    "husky_admission_rejected_total",
+    "Completion requests rejected before processing, by reason",
+    ("reason",)
+)
+ADMISSION_REJECTED_LAG = ADMISSION_REJECTED.labels("loop_lag")
+ADMISSION_REJECTED_IN_FLIGHT = ADMISSION_REJECTED.labels("in_flight")
+OPEN = gauge(
+    "husky_open",
+    "Current size of the per-request registries and queues",
+    ("registry",)
+)
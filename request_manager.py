@@ -1,86 +1,195 @@
-import json
 import time
+import metrics
+import tracing
+import asyncio
+from typing import Dict, Optional
 from logger import Logger
-from manager import BaseManager
+from manager import BaseManager, request_fingerprint
+from websocket_manager import Session
+from response_cache import ResponseCache, CACHE_CONFIG
+from disk_cache import DiskCache, KIND_RESPONSE
 from fastapi import HTTPException, BackgroundTasks
 from fastapi.responses import JSONResponse
 from fastapi import BackgroundTasks
 
 class RequestManager(BaseManager):
-    def __init__(self, ws_manager):
+    def __init__(self, ws_manager, cache: Optional[ResponseCache] = None, disk_cache: Optional[DiskCache] = None):
         super().__init__(ws_manager)
         self.logger = Logger("RequestManager")
+        self.cache = cache if cache is not None else (ResponseCache() if CACHE_CONFIG['enabled'] else None)
+        self.disk_cache = disk_cache
+        # 正在进行中的上游请求，按 (钱包, 请求指纹) 合并相同请求；
+        # 上游请求在发起者钱包的认证会话上发出，不能让其他钱包的请求搭车
+        self.in_flight: Dict[tuple, asyncio.Task] = {}
+        self.stats = {
+            "upstream": 0,
+            "coalesced": 0
+        }
 
-    async def create_request(self, request_id: str):
-        """Create and register a request queue"""
+    def request_metrics(self) -> Dict:
+        """Counters for upstream and coalesced non-stream requests"""
+        stats = dict(self.stats)
+        stats["in_flight"] = len(self.in_flight)
+        if self.cache is not None:
+            stats["cache"] = self.cache.cache_stats()
+        if self.disk_cache is not None:
+            stats["disk_cache"] = self.disk_cache.cache_stats()
+        return stats
+
+    async def create_request(self, request_id: str) -> asyncio.Future:
+        """Create and register a one-shot response slot"""
         try:
-            # Create queue
-            queue = await self.create_queue(request_id)
-            return queue
+            return self.create_waiter(request_id)
         except Exception as e:
             self.logger.error(f"Error creating request: {str(e)}")
             raise
 
     def cleanup_request(self, request_id: str, background_tasks: BackgroundTasks):
-        """Cleanup request queue in background using FastAPI BackgroundTasks"""
+        """Cleanup request response slot in background using FastAPI BackgroundTasks"""
         async def background_cleanup():
             try:
-                await self.cleanup_queue(request_id)
+                self.ws_manager.unregister_waiter(request_id)
             except Exception as e:
                 self.logger.error(f"Error cleaning up request: {str(e)}")
 
         # Add cleanup task to FastAPI's BackgroundTasks
         background_tasks.add_task(background_cleanup)
 
-    async def process_request(self, request_id: str, request: dict) -> dict:
-        """Process non-stream request and return response"""
-        self.logger.info(f"Processing non-stream request {request_id}")
-        
+    async def fetch_response(self, request_id: str, request: dict, session: Optional[Session] = None) -> dict:
+        """Send one request upstream (on session when given) and wait for its raw response"""
         try:
-            # Create queue first to ensure it exists before sending
-            await self.create_request(request_id)
+            # Create the response slot first to ensure it exists before sending
+            waiter = await self.create_request(request_id)
             
             # Send request
-            await self.ws_manager.send(json.dumps(request), request_id)
+            self.stats["upstream"] += 1
+            tracing.start(request_id, "send")
+            await self.send_upstream(request_id, request, session)
+            tracing.end(request_id, "send")
             
             # Wait for response
-            response = await self.wait_for_response(request_id, timeout=30)
+            return await self.wait_for_response(request_id, waiter, timeout=30)
+        finally:
+            self.ws_manager.unregister_waiter(request_id)
+
+    def _fetch_shared(self, key: str, request_id: str, request: dict, session: Optional[Session] = None,
+                      wallet: Optional[str] = None) -> asyncio.Task:
+        """Join the wallet's in-flight upstream request with the same fingerprint, or start one"""
+        shared = (wallet, key)
+        task = self.in_flight.get(shared)
+        if task:
+            self.stats["coalesced"] += 1
+            self.logger.info("Coalesced request %s into in-flight request %s", request_id, key[:12])
+            return task
+
+        def done(finished: asyncio.Task):
+            self.in_flight.pop(shared, None)
+            # Mark the exception as retrieved when every waiter went away
+            if not finished.cancelled():
+                finished.exception()
+
+        task = asyncio.create_task(self.fetch_response(request_id, request, session))
+        task.add_done_callback(done)
+        self.in_flight[shared] = task
+        return task
+
+    async def _cached_response(self, key: str) -> Optional[dict]:
+        """Look up the memory cache, then the disk cache (promoting hits to memory)"""
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        if self.disk_cache is not None:
+            cached = await self.disk_cache.get_background(KIND_RESPONSE, key)
+            if cached is not None and self.cache is not None:
+                self.cache.set(key, cached)
+            return cached
+        return None
+
+    def _store_response(self, key: str, response: dict):
+        value = {
+            "code": 200,
+            "response": response.get("response", ""),
+            "tokens_burned": response.get("tokens_burned", 0)
+        }
+        if self.cache is not None:
+            self.cache.set(key, value)
+        if self.disk_cache is not None:
+            self.disk_cache.put_background(KIND_RESPONSE, key, value)
+
+    def build_response(self, request_id: str, model: str, response: dict) -> JSONResponse:
+        """Render an upstream response in OpenAI chat.completion format"""
+        return JSONResponse(content={
+            "id": request_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": response.get("response", "")
+                    },
+                    "finish_reason": None
+                }
+            ],
+            "usage": {
+                "prompt_tokens": 0,
+                "completion_tokens": response.get("tokens_burned", 0),
+                "total_tokens": response.get("tokens_burned", 0)
+            }
+        })
+
+    async def process_request(self, request_id: str, request: dict, cache_lookup: bool = True, cache_store: bool = True,
+                              session: Optional[Session] = None, wallet: Optional[str] = None) -> dict:
+        """Process non-stream request and return response
+
+        session is the upstream connection the caller's wallet is
+        authenticated on; the upstream call is sent there. Only requests
+        from the same wallet share an in-flight upstream call.
+        """
+        self.logger.info("Processing non-stream request %s", request_id)
+        started = time.perf_counter()
+        model = request["args"]["model"]
+        
+        try:
+            key = request_fingerprint(request)
+            if cache_lookup:
+                tracing.start(request_id, "cache")
+                cached = await self._cached_response(key)
+                tracing.end(request_id, "cache")
+                if cached is not None:
+                    self.logger.info("Serving request %s from response cache", request_id)
+                    return self.build_response(request_id, model, cached)
+
+            # Identical requests in flight share one upstream call; shield it
+            # so a disconnecting caller does not cancel it for the others
+            tracing.start(request_id, "upstream")
+            response = await asyncio.shield(self._fetch_shared(key, request_id, request, session, wallet))
+            tracing.end(request_id, "upstream")
             
             if response and response.get("code") == 200:
-                return JSONResponse(content={
-                    "id": request_id,
-                    "object": "chat.completion",
-                    "created": int(time.time()),
-                    "model": request["args"]["model"],
-                    "choices": [
-                        {
-                            "index": 0,
-                            "message": {
-                                "role": "assistant",
-                                "content": response.get("response", "")
-                            },
-                            "finish_reason": None
-                        }
-                    ],
-                    "usage": {
-                        "prompt_tokens": 0,
-                        "completion_tokens": response.get("tokens_burned", 0),
-                        "total_tokens": response.get("tokens_burned", 0)
-                    }
-                })
+                if cache_store:
+                    self._store_response(key, response)
+                tracing.start(request_id, "render")
+                rendered = self.build_response(request_id, model, response)
+                tracing.end(request_id, "render")
+                return rendered
             else:
                 error_msg = response.get("message", "Unknown error")
                 raise HTTPException(status_code=500, detail=error_msg)
         except Exception as e:
             self.logger.error(f"Error processing request: {str(e)}")
-            # Cleanup queue on error in background
-            self.cleanup_request(request_id, background_tasks)
             raise
+        finally:
+            metrics.REQUEST_LATENCY.labels(model, request["args"].get("provider", "unknown"), "false").observe(time.perf_counter() - started)
 
-    async def handle_request(self, request_id: str, request: dict, background_tasks: BackgroundTasks) -> dict:
+    async def handle_request(self, request_id: str, request: dict, background_tasks: BackgroundTasks, cache_lookup: bool = True, cache_store: bool = True,
+                             session: Optional[Session] = None, wallet: Optional[str] = None) -> dict:
         """Handle non-stream request with cleanup"""
         try:
-            return await self.process_request(request_id, request)
+            return await self.process_request(request_id, request, cache_lookup, cache_store, session, wallet)
         finally:
             # Cleanup in background
             self.cleanup_request(request_id, background_tasks)
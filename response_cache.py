@@ -0,0 +1,94 @@
+import time
+import codec
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# 响应缓存配置
+CACHE_CONFIG = {
+    'enabled': True,
+    'max_entries': 1024,
+    'max_bytes': 64 * 1024 * 1024,
+    'ttl': 300
+}
+
+def cache_policy(cache_control: Optional[str]) -> Tuple[bool, bool]:
+    """Map a Cache-Control request header to (lookup, store)
+
+    no-cache skips the lookup but still stores the fresh response;
+    no-store bypasses the cache entirely.
+    """
+    if not cache_control:
+        return True, True
+    directives = {d.strip().lower() for d in cache_control.split(",")}
+    if "no-store" in directives:
+        return False, False
+    if "no-cache" in directives:
+        return False, True
+    return True, True
+
+class ResponseCache:
+    """In-process LRU cache with TTL and entry-count/byte-size limits"""
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_entries = max_entries or CACHE_CONFIG['max_entries']
+        self.max_bytes = max_bytes or CACHE_CONFIG['max_bytes']
+        self.ttl = ttl or CACHE_CONFIG['ttl']
+        # key -> (expires_at, size, value)，按最近使用排序
+        self.entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self.bytes = 0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0
+        }
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        if entry[0] <= time.monotonic():
+            self._remove(key)
+            self.stats["expirations"] += 1
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry[2]
+
+    def set(self, key: str, value: Any) -> bool:
+        size = len(codec.dumpb(value))
+        if size > self.max_bytes:
+            return False
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (time.monotonic() + self.ttl, size, value)
+        self.bytes += size
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._evict()
+        return True
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def _remove(self, key: str):
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def _evict(self):
+        """Drop the least recently used entry; expired ones are dropped lazily in get()"""
+        key, (_, size, _) = self.entries.popitem(last=False)
+        self.bytes -= size
+        self.stats["evictions"] += 1
+
+    def cache_stats(self) -> Dict:
+        stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = len(self.entries)
+        stats["bytes"] = self.bytes
+        return stats
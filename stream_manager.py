@@ -1,17 +1,99 @@
 from logger import Logger
-from manager import BaseManager
+from manager import BaseManager, request_fingerprint
+from websocket_manager import Session
+from disk_cache import DiskCache, KIND_STREAM
 from fastapi import HTTPException, BackgroundTasks
 from fastapi.responses import StreamingResponse
-from typing import AsyncGenerator
-import json
+from typing import AsyncGenerator, Dict, List, Optional
+import codec
 import time
+import metrics
+import tracing
+import timing_wheel
 import asyncio
 
+# 流式输出配置
+STREAM_CONFIG = {
+    # 首个 token 与相邻 token 之间的最长等待时间（秒）
+    'first_token_timeout': 30,
+    'chunk_timeout': 30,
+    # 合并窗口（秒），0 表示关闭合并，每个上游 chunk 单独输出一个事件；max_coalesce_window 为请求头可设置的上限
+    'coalesce_window': 0,
+    'max_coalesce_window': 1,
+    # 单个合并事件的最大字节数
+    'coalesce_bytes': 1024
+}
+
+# SSE 控制事件
+SSE_DONE = b"data: [DONE]\n\n"
+SSE_TIMEOUT = b"data: [TIMEOUT]\n\n"
+
+class StreamDeadline:
+    """Marker the timing wheel puts on a stream queue when a deadline passes"""
+    __slots__ = ("kind",)
+
+    def __init__(self, kind: str):
+        self.kind = kind
+
+class ChunkTemplate:
+    """Pre-rendered chat.completion.chunk envelope for one stream
+
+    The id, model and created fields are rendered once; each chunk only
+    JSON-escapes the token and splices it between the fixed halves.
+    """
+    __slots__ = ("prefix", "suffix")
+
+    def __init__(self, request_id: str, model: str, created: int = None):
+        envelope = codec.dumpb({
+            "id": request_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()) if created is None else created,
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": {
+                        "content": ""
+                    },
+                    "finish_reason": None
+                }
+            ]
+        })
+        head, marker, tail = envelope.rpartition(b'"content":""')
+        self.prefix = b"data: " + head + b'"content":'
+        self.suffix = tail + b"\n\n"
+
+    def render(self, token: str) -> bytes:
+        return self.prefix + codec.dumpb(token) + self.suffix
+
 class StreamManager(BaseManager):
-    def __init__(self, ws_manager):
+    def __init__(self, ws_manager, coalesce_window: Optional[float] = None, coalesce_bytes: Optional[int] = None,
+                 disk_cache: Optional[DiskCache] = None):
         super().__init__(ws_manager)
         self.stream_tasks = {}  # Store stream response tasks
         self.logger = Logger("StreamManager")
+        self.coalesce_window = STREAM_CONFIG['coalesce_window'] if coalesce_window is None else coalesce_window
+        self.coalesce_bytes = coalesce_bytes or STREAM_CONFIG['coalesce_bytes']
+        self.disk_cache = disk_cache
+        self.stats = {
+            "streams": 0,
+            "replayed": 0,
+            "frames": 0,
+            "events": 0,
+            "duration": 0.0
+        }
+
+    def stream_metrics(self) -> Dict:
+        """Totals over finished streams, including the event reduction from coalescing"""
+        stats = dict(self.stats)
+        duration = stats["duration"] or 1e-9
+        stats["frames_per_sec"] = stats["frames"] / duration
+        stats["events_per_sec"] = stats["events"] / duration
+        stats["event_reduction"] = 1 - stats["events"] / stats["frames"] if stats["frames"] else 0.0
+        stats["coalesce_window"] = self.coalesce_window
+        if self.disk_cache is not None:
+            stats["disk_cache"] = self.disk_cache.cache_stats()
+        return stats
 
     async def create_stream(self, request_id: str):
         """Create and register a stream queue"""
@@ -32,93 +114,263 @@ class StreamManager(BaseManager):
                     del self.stream_tasks[request_id]
             except Exception as e:
                 self.logger.error(f"Error cleaning up stream: {str(e)}")
+            # 客户端在流开始前断开时，generate_stream 不会结束追踪
+            tracing.finish(request_id)
 
         # Add cleanup task to FastAPI's BackgroundTasks
         background_tasks.add_task(background_cleanup)
 
-    async def process_stream(self, request_id: str, request: str) -> StreamingResponse:
-        """Process stream request and return streaming response"""
-        self.logger.info(f"Processing stream request {request_id}")
+    async def process_stream(self, request_id: str, request: str, coalesce_window: Optional[float] = None,
+                             cache_lookup: bool = True, cache_store: bool = True,
+                             session: Optional[Session] = None) -> StreamingResponse:
+        """Process stream request and return streaming response
+
+        session is the upstream connection the caller's wallet is
+        authenticated on; the request is sent there.
+        """
+        self.logger.info("Processing stream request %s", request_id)
         
         try:
+            # Get model from request
+            model = request.get("args", {}).get("model", "unknown")
+            provider = request.get("args", {}).get("provider", "unknown")
+
+            # Replay a cached transcript instead of going upstream
+            transcript_key = request_fingerprint(request) if self.disk_cache is not None else None
+            if transcript_key and cache_lookup:
+                transcript = await self.disk_cache.get_background(KIND_STREAM, transcript_key)
+                if transcript is not None:
+                    self.logger.info("Replaying stream %s from disk cache", request_id)
+                    return StreamingResponse(
+                        self.replay_stream(request_id, model, transcript),
+                        media_type="text/event-stream"
+                    )
+
             # Create queue first to ensure it exists before sending
             await self.create_stream(request_id)
             
             # Send request
-            await self.ws_manager.send(json.dumps(request), request_id)
-            
-            # Get model from request
-            model = request.get("model", "unknown")
+            sent_at = time.monotonic()
+            tracing.start(request_id, "send")
+            await self.send_upstream(request_id, request, session)
+            tracing.end(request_id, "send")
+            tracing.start(request_id, "first_token")
             
             # Create streaming response
-            return await self.stream_response(request_id, model)
+            return await self.stream_response(request_id, model, coalesce_window, transcript_key if cache_store else None,
+                                              provider, sent_at)
             
+        except HTTPException:
+            raise
         except Exception as e:
             import traceback
             error_msg = f"Error processing stream request: {str(e)}\nTraceback:\n{traceback.format_exc()}"
             self.logger.error(error_msg)
             raise HTTPException(status_code=500, detail=str(e))
 
-    async def handle_stream(self, request_id: str, request: str, background_tasks: BackgroundTasks) -> StreamingResponse:
-        """Handle stream request with cleanup"""
+    async def handle_stream(self, request_id: str, request: str, background_tasks: BackgroundTasks, coalesce_window: Optional[float] = None,
+                            cache_lookup: bool = True, cache_store: bool = True,
+                            session: Optional[Session] = None) -> StreamingResponse:
+        """Handle stream request with cleanup
+
+        coalesce_window overrides the deployment coalescing window for this
+        request (None keeps the default, 0 turns coalescing off).
+        """
         try:
-            return await self.process_stream(request_id, request)
+            return await self.process_stream(request_id, request, coalesce_window, cache_lookup, cache_store, session)
         finally:
             # Cleanup queue on error in background
             self.cleanup_stream(request_id, background_tasks)
 
-    async def generate_stream(self, request_id: str, model: str) -> AsyncGenerator[str, None]:
-        """Generate stream response in OpenAI format"""
-        self.logger.info(f"Generating stream for request {request_id}")
+    async def _next_frame(self, queue: asyncio.Queue, timeout: float, kind: str) -> Optional[dict]:
+        """Get the next upstream frame, or None when the deadline passes first
+
+        The deadline is only armed while the queue is empty, so a slow client
+        never counts against the upstream. Markers from deadlines that fired
+        after their frame had already arrived are skipped.
+        """
+        marker = timer = None
+        try:
+            while True:
+                if timer is None and queue.empty():
+                    marker = StreamDeadline(kind)
+                    timer = timing_wheel.schedule(timeout, queue.put_nowait, marker)
+                data = await queue.get()
+                if data is marker:
+                    return None
+                if not isinstance(data, StreamDeadline):
+                    return data
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    async def _coalesce(self, queue: asyncio.Queue, parts: List[str], window: float) -> Optional[str]:
+        """Merge tokens arriving within the window or byte budget into parts
+
+        Returns "end" when the stream end frame was consumed and "timeout"
+        when no frame arrived within chunk_timeout, which applies inside
+        the window as well. Waits use StreamDeadline markers on the queue
+        rather than wait_for, so no task or future is created per flush.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + window
+        chunk_timeout = STREAM_CONFIG['chunk_timeout']
+        size = len(parts[0].encode("utf-8"))
+        marker = timer = None
+        try:
+            while size < self.coalesce_bytes:
+                if not queue.empty():
+                    data = queue.get_nowait()
+                else:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    if remaining >= chunk_timeout:
+                        # 窗口比 chunk_timeout 还长，按普通的 chunk 超时等待下一帧
+                        data = await self._next_frame(queue, chunk_timeout, "chunk")
+                        if data is None:
+                            return "timeout"
+                    else:
+                        if timer is None:
+                            # 时间轮精度为一个 tick，对毫秒级窗口太粗；窗口结束由 loop 定时回调投递同样的标记
+                            marker = StreamDeadline("window")
+                            timer = loop.call_at(deadline, queue.put_nowait, marker)
+                        data = await queue.get()
+                        if data is marker:
+                            break
+                if isinstance(data, StreamDeadline):
+                    continue
+                if data.get("isStreamEnd"):
+                    return "end"
+                token = data.get("chunk", "")
+                parts.append(token)
+                size += len(token.encode("utf-8"))
+            return None
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    async def replay_stream(self, request_id: str, model: str, transcript: List[str]) -> AsyncGenerator[bytes, None]:
+        """Replay a cached stream transcript through the regular SSE formatting"""
+        self.stats["replayed"] += 1
+        template = ChunkTemplate(request_id, model)
+        for token in transcript:
+            yield template.render(token)
+        yield SSE_DONE
+        tracing.finish(request_id, replayed=True)
+
+    async def generate_stream(self, request_id: str, model: str, coalesce_window: Optional[float] = None,
+                              transcript_key: Optional[str] = None, provider: str = "unknown",
+                              sent_at: Optional[float] = None) -> AsyncGenerator[bytes, None]:
+        """Generate stream response in OpenAI format
+
+        When transcript_key is set, the upstream chunks are collected and
+        stored in the disk cache once the stream ends normally. sent_at is
+        the monotonic time the request went upstream; latency and time to
+        first token are measured from it.
+        """
+        self.logger.info("Generating stream for request %s", request_id)
+        window = self.coalesce_window if coalesce_window is None else coalesce_window
+        transcript: Optional[List[str]] = [] if transcript_key else None
+        frames = events = 0
+        started = time.monotonic()
+        sent_at = started if sent_at is None else sent_at
+        last_frame = None
         
         try:
             queue = self.queues.get(request_id)
             if not queue:
                 self.logger.error(f"Queue not found for request_id: {request_id}")
                 raise HTTPException(status_code=404, detail=f"Stream not found: {request_id}")
-                
+
+            template = ChunkTemplate(request_id, model)
             while True:
                 try:
-                    data = await asyncio.wait_for(queue.get(), timeout=30)
+                    if frames:
+                        data = await self._next_frame(queue, STREAM_CONFIG['chunk_timeout'], "inter-token")
+                    else:
+                        data = await self._next_frame(queue, STREAM_CONFIG['first_token_timeout'], "first-token")
+                    if data is None:
+                        kind = "inter-token" if frames else "first-token"
+                        self.logger.warn(f"Stream {kind} timeout for request {request_id}")
+                        metrics.TIMEOUT_BY_TYPE[kind].inc()
+                        yield SSE_TIMEOUT
+                        break
+                    now = time.monotonic()
+                    if last_frame is None:
+                        metrics.TIME_TO_FIRST_TOKEN.labels(model, provider).observe(now - sent_at)
+                        tracing.end(request_id, "first_token")
+                        tracing.start(request_id, "stream")
+                    else:
+                        metrics.INTER_TOKEN_GAP.observe(now - last_frame)
+                    last_frame = now
                     if "isStreamEnd" in data and data["isStreamEnd"]:
-                        yield f"data: [DONE]\n\n"
+                        self._store_transcript(transcript_key, transcript)
+                        yield SSE_DONE
                         break
+                    elif window > 0:
+                        parts = [data.get("chunk", "")]
+                        outcome = await self._coalesce(queue, parts, window)
+                        frames += len(parts)
+                        events += 1
+                        if transcript is not None:
+                            transcript.extend(parts)
+                        yield template.render("".join(parts))
+                        if outcome == "end":
+                            self._store_transcript(transcript_key, transcript)
+                            yield SSE_DONE
+                            break
+                        if outcome == "timeout":
+                            self.logger.warn(f"Stream inter-token timeout for request {request_id}")
+                            metrics.TIMEOUT_BY_TYPE["inter-token"].inc()
+                            yield SSE_TIMEOUT
+                            break
                     else:
                         token = data.get("chunk", "")
-                        chunk = {
-                            "id": request_id,
-                            "object": "chat.completion.chunk",
-                            "created": int(time.time()),
-                            "model": model,
-                            "choices": [
-                                {
-                                    "index": 0,
-                                    "delta": {
-                                        "content": token
-                                    },
-                                    "finish_reason": None
-                                }
-                            ]
-                        }
-                        yield f"data: {json.dumps(chunk)}\n\n"
-                except asyncio.TimeoutError:
-                    self.logger.warn(f"Stream timeout for request {request_id}")
-                    yield f"data: [TIMEOUT]\n\n"
-                    break
+                        frames += 1
+                        events += 1
+                        if transcript is not None:
+                            transcript.append(token)
+                        yield template.render(token)
                 except Exception as e:
                     self.logger.error(f"Error in stream generation: {str(e)}")
                     raise HTTPException(status_code=500, detail=str(e))
         except Exception as e:
             self.logger.error(f"Stream generation error: {str(e)}")
             raise
+        finally:
+            finished = time.monotonic()
+            self._record_stream(request_id, frames, events, finished - started)
+            metrics.REQUEST_LATENCY.labels(model, provider, "true").observe(finished - sent_at)
+            if frames:
+                metrics.TOKENS_PER_SECOND.labels(model, provider).observe(frames / max(finished - sent_at, 1e-9))
+            tracing.finish(request_id, frames=frames, events=events)
+
+    def _store_transcript(self, key: Optional[str], transcript: Optional[List[str]]):
+        if key and transcript:
+            self.disk_cache.put_background(KIND_STREAM, key, transcript)
+
+    def _record_stream(self, request_id: str, frames: int, events: int, duration: float):
+        self.stats["streams"] += 1
+        self.stats["frames"] += frames
+        self.stats["events"] += events
+        self.stats["duration"] += duration
+        if frames:
+            self.logger.info(
+                f"Stream {request_id} finished: {frames} frames -> {events} events "
+                f"({1 - events / frames:.0%} fewer), "
+                f"{events / max(duration, 1e-9):.1f} events/s vs {frames / max(duration, 1e-9):.1f} frames/s"
+            )
 
-    async def stream_response(self, request_id: str, model: str) -> StreamingResponse:
+    async def stream_response(self, request_id: str, model: str, coalesce_window: Optional[float] = None,
+                              transcript_key: Optional[str] = None, provider: str = "unknown",
+                              sent_at: Optional[float] = None) -> StreamingResponse:
         """Create streaming response"""
-        self.logger.info(f"Creating streaming response for request {request_id}")
+        self.logger.info("Creating streaming response for request %s", request_id)
         
         try:
             return StreamingResponse(
-                self.generate_stream(request_id, model),
+                self.generate_stream(request_id, model, coalesce_window, transcript_key, provider, sent_at),
                 media_type="text/event-stream"
             )
         except Exception as e:
@@ -0,0 +1,123 @@
+"""
+Hashed timing wheel shared by all proxy timeouts.
+
+Deadlines are put into one of `slots` buckets by expiry tick, so both
+registering and cancelling take O(1) time. A single loop timer advances
+the wheel once per tick while any deadline is pending, no matter how many
+requests or streams are open. Deadlines fire up to one tick late.
+"""
+import asyncio
+import math
+import weakref
+from typing import Any, Callable, Optional, Set
+
+# 时间轮配置：tick 为精度（秒），slots * tick 为单圈覆盖的时长
+WHEEL_CONFIG = {
+    'tick': 0.1,
+    'slots': 1024
+}
+
+class TimerHandle:
+    __slots__ = ("wheel", "expiry", "callback", "args", "bucket")
+
+    def __init__(self, wheel: "TimingWheel", expiry: int, callback: Callable, args: tuple, bucket: Set["TimerHandle"]):
+        self.wheel = wheel
+        self.expiry = expiry
+        self.callback = callback
+        self.args = args
+        self.bucket = bucket
+
+    def cancel(self):
+        if self.bucket is not None:
+            self.bucket.discard(self)
+            self.bucket = None
+            self.wheel.pending -= 1
+
+    @property
+    def active(self) -> bool:
+        return self.bucket is not None
+
+class TimingWheel:
+    def __init__(self, loop: asyncio.AbstractEventLoop, tick: Optional[float] = None, slots: Optional[int] = None):
+        self.loop = loop
+        self.tick = tick or WHEEL_CONFIG['tick']
+        self.slots = slots or WHEEL_CONFIG['slots']
+        self.buckets = [set() for _ in range(self.slots)]
+        self.origin = loop.time()
+        self.current = 0  # 已处理到的 tick
+        self.pending = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.stats = {
+            "scheduled": 0,
+            "fired": 0
+        }
+
+    def __len__(self) -> int:
+        return self.pending
+
+    def _now_tick(self) -> int:
+        return int((self.loop.time() - self.origin) / self.tick)
+
+    def schedule(self, delay: float, callback: Callable, *args: Any) -> TimerHandle:
+        """Call callback(*args) after delay seconds (rounded up to the next tick)"""
+        now = self._now_tick()
+        if self.timer is None:
+            # The wheel was idle; resume counting from the current time
+            self.current = now
+        # Count from the real time, not self.current: while the loop is
+        # blocked the wheel falls behind, and catching up would fire early
+        expiry = now + max(1, math.ceil(delay / self.tick))
+        bucket = self.buckets[expiry % self.slots]
+        handle = TimerHandle(self, expiry, callback, args, bucket)
+        bucket.add(handle)
+        self.pending += 1
+        self.stats["scheduled"] += 1
+        if self.timer is None:
+            self._arm()
+        return handle
+
+    def _arm(self):
+        self.timer = self.loop.call_at(self.origin + (self.current + 1) * self.tick, self._advance)
+
+    def _advance(self):
+        self.timer = None
+        target = self._now_tick()
+        while self.current < target:
+            self.current += 1
+            bucket = self.buckets[self.current % self.slots]
+            if not bucket:
+                continue
+            due = [handle for handle in bucket if handle.expiry <= self.current]
+            for handle in due:
+                bucket.discard(handle)
+                handle.bucket = None
+                self.pending -= 1
+                self.stats["fired"] += 1
+                try:
+                    handle.callback(*handle.args)
+                except Exception as e:
+                    self.loop.call_exception_handler({
+                        "message": "Timing wheel callback failed",
+                        "exception": e
+                    })
+        if self.pending:
+            self._arm()
+
+_wheels: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, TimingWheel]" = weakref.WeakKeyDictionary()
+
+def get_wheel() -> TimingWheel:
+    """The timing wheel of the running event loop"""
+    loop = asyncio.get_running_loop()
+    wheel = _wheels.get(loop)
+    if wheel is None:
+        wheel = TimingWheel(loop)
+        _wheels[loop] = wheel
+    return wheel
+
+def schedule(delay: float, callback: Callable, *args: Any) -> TimerHandle:
+    return get_wheel().schedule(delay, callback, *args)
+
+def expire(future: asyncio.Future):
+    """Timer callback that fails a pending future with TimeoutError"""
+    if not future.done():
+        future.set_exception(asyncio.TimeoutError())
@@ -0,0 +1,154 @@
+"""
+Per-request phase timing for chat completions.
+
+A RequestTrace is opened for each request id and looked up by id in the
+managers, the same way queues and waiters are. Phases are recorded with
+start()/end() pairs on time.perf_counter(). When the request finishes the
+trace is rendered as a Server-Timing header value (non-stream responses),
+logged as a structured record through the "Trace" logger and, when an OTLP
+file is configured, appended to it as one OTLP/JSON ExportTraceServiceRequest
+per line through a FileTarget, so file I/O stays off the event loop.
+"""
+import os
+import time
+import codec
+from typing import Any, Dict, List, Optional, Tuple
+from logger import Logger
+from file_target import FileTarget
+
+# 追踪配置：otlp_file 为 None 时不导出 OTLP JSON
+TRACE_CONFIG = {
+    'enabled': True,
+    'log': True,
+    'otlp_file': None,
+    'service_name': 'husky-proxy'
+}
+
+class RequestTrace:
+    __slots__ = ("request_id", "trace_id", "started", "wall_started", "phases", "open", "attributes")
+
+    def __init__(self, request_id: str, **attributes: Any):
+        self.request_id = request_id
+        # request_id 是 uuid4，去掉连字符正好是 OTLP 要求的 32 位十六进制 trace id
+        self.trace_id = request_id.replace("-", "")
+        self.started = time.perf_counter()
+        self.wall_started = time.time_ns()
+        self.phases: List[Tuple[str, float, float]] = []  # (名称, 开始, 耗时)，单位秒
+        self.open: Dict[str, float] = {}
+        self.attributes = attributes
+
+    def start(self, name: str) -> None:
+        self.open[name] = time.perf_counter()
+
+    def end(self, name: str) -> None:
+        started = self.open.pop(name, None)
+        if started is not None:
+            self.phases.append((name, started, time.perf_counter() - started))
+
+    def duration(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, durations in milliseconds"""
+        entries = [f"{name};dur={duration * 1000:.2f}" for name, _, duration in self.phases]
+        entries.append(f"total;dur={self.duration() * 1000:.2f}")
+        return ", ".join(entries)
+
+    def record(self, duration: float) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "duration_ms": round(duration * 1000, 3),
+            "phases": {name: round(phase * 1000, 3) for name, _, phase in self.phases},
+            **self.attributes
+        }
+
+    def otlp(self, duration: float, service_name: str) -> Dict[str, Any]:
+        """One ExportTraceServiceRequest: a root span plus a child span per phase"""
+        def nanos(offset: float) -> str:
+            return str(self.wall_started + int((offset - self.started) * 1e9))
+
+        root_id = os.urandom(8).hex()
+        attributes = [{"key": "request.id", "value": {"stringValue": self.request_id}}]
+        attributes += [
+            {"key": key, "value": {"stringValue": str(value)}}
+            for key, value in self.attributes.items()
+        ]
+        spans = [{
+            "traceId": self.trace_id,
+            "spanId": root_id,
+            "name": "chat.completions",
+            "kind": 2,  # SPAN_KIND_SERVER
+            "startTimeUnixNano": nanos(self.started),
+            "endTimeUnixNano": nanos(self.started + duration),
+            "attributes": attributes
+        }]
+        spans += [
+            {
+                "traceId": self.trace_id,
+                "spanId": os.urandom(8).hex(),
+                "parentSpanId": root_id,
+                "name": name,
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": nanos(started),
+                "endTimeUnixNano": nanos(started + phase)
+            }
+            for name, started, phase in self.phases
+        ]
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+                "scopeSpans": [{"scope": {"name": service_name}, "spans": spans}]
+            }]
+        }
+
+logger = Logger("Trace")
+traces: Dict[str, RequestTrace] = {}
+exporter: Optional[FileTarget] = None
+
+def configure(otlp_file: Optional[str] = None) -> None:
+    """Open (or close) the OTLP JSON export file"""
+    global exporter
+    if exporter is not None:
+        exporter.close()
+        exporter = None
+    if otlp_file:
+        exporter = FileTarget(otlp_file, compress=False)
+
+def close() -> None:
+    configure(None)
+
+def begin(request_id: str, **attributes: Any) -> Optional[RequestTrace]:
+    if not TRACE_CONFIG['enabled']:
+        return None
+    trace = RequestTrace(request_id, **attributes)
+    traces[request_id] = trace
+    return trace
+
+def get(request_id: str) -> Optional[RequestTrace]:
+    return traces.get(request_id)
+
+def start(request_id: str, name: str) -> None:
+    trace = traces.get(request_id)
+    if trace is not None:
+        trace.start(name)
+
+def end(request_id: str, name: str) -> None:
+    trace = traces.get(request_id)
+    if trace is not None:
+        trace.end(name)
+
+def finish(request_id: str, **attributes: Any) -> Optional[RequestTrace]:
+    """Close the trace, log its record and export it; returns the trace"""
+    trace = traces.pop(request_id, None)
+    if trace is None:
+        return None
+    duration = trace.duration()
+    # 未结束的阶段（如客户端断开的流）以结束时间截断
+    for name in list(trace.open):
+        trace.end(name)
+    trace.attributes.update(attributes)
+    if TRACE_CONFIG['log'] and logger.is_enabled(Logger.INFO):
+        logger.info("%j", trace.record(duration))
+    if exporter is not None:
+        exporter.write_line(codec.dumps(trace.otlp(duration, TRACE_CONFIG['service_name'])))
+    return trace
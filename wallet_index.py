@@ -0,0 +1,251 @@
+"""
+Compact membership index for authenticated wallets.
+
+Wallet addresses are reduced to 64-bit blake2b digests and stored in an
+open-addressing hash table with linear probing. The table is four flat
+arrays (digest, expiry, connection generation and last use) instead of a
+Python str, tuple and dict node per wallet: 20 bytes per slot and no
+per-entry objects. At a million wallets the chance of any two digests
+colliding is about 3e-8.
+
+An expiry of 0 marks an empty slot and 1 a deleted one. Expired entries
+are dropped lazily on lookup and whenever the table is rebuilt. Beyond
+max_entries, an approximate LRU eviction samples a few occupied slots and
+drops the least recently used one. An optional Bloom filter in front of
+the table answers most lookups for unknown wallets without probing it;
+in CPython the bit tests cost about as much as a short probe, so it pays
+off only when the table itself is expensive to reach.
+"""
+import time
+import random
+import hashlib
+from array import array
+from typing import Dict, Optional
+
+# 钱包索引配置：bloom_bits 为每个条目的 Bloom 过滤器位数，0 表示不启用
+WALLET_INDEX_CONFIG = {
+    'initial_slots': 1024,
+    'max_load': 0.7,
+    'bloom_bits': 10,
+    'bloom_hashes': 4,
+    'eviction_samples': 5
+}
+
+_DIGEST_SIZE = 8
+_EMPTY = 0
+_DELETED = 1
+
+def wallet_digest(wallet_address: str) -> int:
+    return int.from_bytes(hashlib.blake2b(wallet_address.encode(), digest_size=_DIGEST_SIZE).digest(), "little")
+
+class WalletIndex:
+    def __init__(self, max_entries: int, ttl: float, bloom: bool = True, initial_slots: Optional[int] = None):
+        self.max_entries = max_entries
+        self.ttl = int(ttl)
+        self.max_load = WALLET_INDEX_CONFIG['max_load']
+        self.count = 0  # 占用的条目（含尚未清理的过期条目）
+        self.filled = 0  # 占用 + 已删除的槽位，决定何时重建
+        self._allocate(initial_slots or WALLET_INDEX_CONFIG['initial_slots'])
+
+        self.bloom: Optional[bytearray] = None
+        if bloom and WALLET_INDEX_CONFIG['bloom_bits']:
+            # 按 max_entries 一次分配，扩容时无需重建；位数取 2 的幂便于取模
+            bits = 1 << max(10, (max_entries * WALLET_INDEX_CONFIG['bloom_bits'] - 1).bit_length())
+            self.bloom_mask = bits - 1
+            self.bloom = bytearray(bits >> 3)
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "bloom_rejects": 0,
+            "evictions": 0,
+            "expirations": 0
+        }
+
+    def _allocate(self, slots: int):
+        self.slots = slots
+        self.mask = slots - 1
+        self.keys = array("Q", bytes(8 * slots))
+        self.expires = array("I", bytes(4 * slots))
+        self.generations = array("I", bytes(4 * slots))
+        self.last_used = array("I", bytes(4 * slots))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, wallet_address: str) -> bool:
+        return self.get(wallet_address) is not None
+
+    # ------------------------------------
+    # 查找与写入
+    # ------------------------------------
+    def _find(self, digest: int) -> int:
+        """Slot holding digest, or -1"""
+        keys = self.keys
+        expires = self.expires
+        mask = self.mask
+        slot = digest & mask
+        while True:
+            expiry = expires[slot]
+            if expiry == _EMPTY:
+                return -1
+            if expiry != _DELETED and keys[slot] == digest:
+                return slot
+            slot = (slot + 1) & mask
+
+    def _free_slot(self, digest: int) -> int:
+        """First deleted or empty slot on digest's probe sequence"""
+        expires = self.expires
+        mask = self.mask
+        slot = digest & mask
+        while expires[slot] > _DELETED:
+            slot = (slot + 1) & mask
+        return slot
+
+    def get(self, wallet_address: str) -> Optional[int]:
+        """Connection generation of a live entry, or None"""
+        return self.lookup(wallet_digest(wallet_address))
+
+    def lookup(self, digest: int) -> Optional[int]:
+        """get() for a precomputed wallet_digest, when several indexes are checked for one wallet"""
+        if self.bloom is not None and not self._bloom_contains(digest):
+            self.stats["bloom_rejects"] += 1
+            self.stats["misses"] += 1
+            return None
+        slot = self._find(digest)
+        if slot < 0:
+            self.stats["misses"] += 1
+            return None
+        now = int(time.time())
+        if self.expires[slot] <= now:
+            self._delete(slot)
+            self.stats["expirations"] += 1
+            self.stats["misses"] += 1
+            return None
+        self.last_used[slot] = now
+        self.stats["hits"] += 1
+        return self.generations[slot]
+
+    def set(self, wallet_address: str, generation: int) -> None:
+        digest = wallet_digest(wallet_address)
+        slot = self._find(digest)
+        if slot < 0:
+            if self.count >= self.max_entries:
+                self._evict()
+            if self.filled + 1 > self.slots * self.max_load:
+                self._rebuild()
+            slot = self._free_slot(digest)
+            if self.expires[slot] == _EMPTY:
+                self.filled += 1
+            self.keys[slot] = digest
+            self.count += 1
+            if self.bloom is not None:
+                self._bloom_add(digest)
+        now = int(time.time())
+        self.expires[slot] = now + self.ttl
+        self.generations[slot] = generation
+        self.last_used[slot] = now
+
+    def discard(self, wallet_address: str) -> None:
+        slot = self._find(wallet_digest(wallet_address))
+        if slot >= 0:
+            self._delete(slot)
+
+    def clear(self):
+        self._allocate(WALLET_INDEX_CONFIG['initial_slots'])
+        self.count = self.filled = 0
+        if self.bloom is not None:
+            self.bloom = bytearray(len(self.bloom))
+
+    def _delete(self, slot: int):
+        self.expires[slot] = _DELETED
+        self.count -= 1
+
+    def _evict(self):
+        """Approximate LRU: drop the least recently used of a few sampled entries"""
+        expires = self.expires
+        last_used = self.last_used
+        victim = -1
+        samples = 0
+        while samples < WALLET_INDEX_CONFIG['eviction_samples']:
+            slot = random.getrandbits(32) & self.mask
+            if expires[slot] > _DELETED:
+                samples += 1
+                if victim < 0 or last_used[slot] < last_used[victim]:
+                    victim = slot
+        self._delete(victim)
+        self.stats["evictions"] += 1
+
+    def _rebuild(self):
+        """Rehash live entries, doubling the table unless dropping deleted slots leaves enough room
+
+        Expired entries are dropped along the way.
+        """
+        now = int(time.time())
+        old_keys, old_expires = self.keys, self.expires
+        old_generations, old_last_used = self.generations, self.last_used
+        slots = self.slots * 2 if self.count > self.slots * self.max_load * 0.75 else self.slots
+        self._allocate(slots)
+        self.count = self.filled = 0
+        for old in range(len(old_expires)):
+            expiry = old_expires[old]
+            if expiry <= _DELETED:
+                continue
+            if expiry <= now:
+                self.stats["expirations"] += 1
+                continue
+            digest = old_keys[old]
+            slot = self._free_slot(digest)
+            self.keys[slot] = digest
+            self.expires[slot] = expiry
+            self.generations[slot] = old_generations[old]
+            self.last_used[slot] = old_last_used[old]
+            self.count += 1
+            self.filled += 1
+
+    # ------------------------------------
+    # Bloom 过滤器
+    # ------------------------------------
+    def _bloom_positions(self, digest: int):
+        # 双重哈希：h1 + i * h2。h1 取摘要高 32 位（低位用于表内定位），h2 由摘要乘法散列得到
+        h1 = digest >> 32
+        h2 = (((digest * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 32) | 1
+        mask = self.bloom_mask
+        return [(h1 + i * h2) & mask for i in range(WALLET_INDEX_CONFIG['bloom_hashes'])]
+
+    def _bloom_add(self, digest: int):
+        bloom = self.bloom
+        for position in self._bloom_positions(digest):
+            bloom[position >> 3] |= 1 << (position & 7)
+
+    def _bloom_contains(self, digest: int) -> bool:
+        # 查询路径内联位置计算，避免为每次查找构造列表
+        bloom = self.bloom
+        mask = self.bloom_mask
+        position = digest >> 32
+        step = (((digest * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 32) | 1
+        for _ in range(WALLET_INDEX_CONFIG['bloom_hashes']):
+            position &= mask
+            if not bloom[position >> 3] & (1 << (position & 7)):
+                return False
+            position += step
+        return True
+
+    # ------------------------------------
+    # 统计
+    # ------------------------------------
+    def memory_bytes(self) -> int:
+        """Bytes held by the table buffers and the Bloom filter"""
+        total = sum(
+            column.itemsize * len(column)
+            for column in (self.keys, self.expires, self.generations, self.last_used)
+        )
+        return total + (len(self.bloom) if self.bloom is not None else 0)
+
+    def cache_stats(self) -> Dict:
+        stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = self.count
+        stats["slots"] = self.slots
+        stats["bytes"] = self.memory_bytes()
+        return stats
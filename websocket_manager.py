@@ -1,131 +1,249 @@
 import asyncio
 import websockets
-import json
+import time
+import codec
+import metrics
 from datetime import datetime
-from typing import Dict, Optional, List
+from typing import Callable, Dict, Optional, List, Set, Tuple
 from logger import Logger
 
 # WebSocket 配置
 WS_CONFIG = {
     'reconnect_delay': 3,
-    'max_retries': 5
+    'max_retries': 5,
+    'pool_size': 4
 }
 
+class UpstreamConnection:
+    """A single upstream socket in the WebSocketManager pool"""
+    def __init__(self, index: int):
+        self.index = index
+        self.connection: Optional[websockets.WebSocketClientProtocol] = None
+        self.task: Optional[asyncio.Task] = None
+        self.in_flight: Set[str] = set()
+        self.current_retry = 0
+        self.connects = 0
+        # 连接代数：本连接每次（重新）建立时加一；上游会话状态（如钱包认证）只在同一代内有效
+        self.generation = 0
+
+    @property
+    def connected(self) -> bool:
+        return self.connection is not None
+
+    def session(self) -> "Session":
+        """This connection and its current generation"""
+        return self, self.generation
+
+    def stats(self) -> Dict:
+        return {
+            "index": self.index,
+            "connected": self.connected,
+            "in_flight": len(self.in_flight),
+            "connects": self.connects,
+            "generation": self.generation
+        }
+
+# 上游会话：(连接, 连接代数)。钱包认证绑定在会话上，连接重建后失效
+Session = Tuple[UpstreamConnection, int]
+
 class WebSocketManager:
-    def __init__(self, url: str):
+    def __init__(self, url: str, pool_size: Optional[int] = None):
         self.logger = Logger("WebSocketManager")
         self.url = url
-        self.connection: Optional[websockets.WebSocketClientProtocol] = None
+        self.pool_size = max(1, pool_size or WS_CONFIG['pool_size'])
+        self.pool: List[UpstreamConnection] = [UpstreamConnection(i) for i in range(self.pool_size)]
+        self.routes: Dict[str, UpstreamConnection] = {}
         self.listeners: Dict[str, asyncio.Queue] = {}
+        self.waiters: Dict[str, asyncio.Future] = {}
+        # 发送时间，收到该 request_id 的第一条上游消息时用于计算往返时间
+        self.sent_at: Dict[str, float] = {}
         self.stream_queues: Dict[str, asyncio.Queue] = {}
-        self.authenticated_addresses: List[str] = []
         self.running: bool = False
-        self.task: Optional[asyncio.Task] = None
+        self.subscribers: List[Callable[[UpstreamConnection], None]] = []
         self.reconnect_delay = WS_CONFIG['reconnect_delay']
         self.max_retries = WS_CONFIG['max_retries']
-        self.current_retry = 0
         self.last_heartbeat = datetime.now()
-        self.logger.info(f"WebSocketManager initialized with URL: {url}")
+        self.logger.info(f"WebSocketManager initialized with URL: {url} (pool size: {self.pool_size})")
+
+    @property
+    def connection(self) -> Optional[websockets.WebSocketClientProtocol]:
+        """First live upstream connection, if any"""
+        for conn in self.pool:
+            if conn.connection:
+                return conn.connection
+        return None
+
+    def pool_stats(self) -> List[Dict]:
+        """Per-connection in-flight request counts"""
+        return [conn.stats() for conn in self.pool]
 
     async def start_listening(self):
-        """Start the message listener task"""
-        if not self.task:
-            self.running = True
-            self.task = asyncio.create_task(self._listen())
-            self.logger.info("Started message listener")
-
-    async def _listen(self):
-        """Continuously listen for WebSocket messages and route them"""
+        """Start one message listener task per pooled connection"""
+        self.running = True
+        for conn in self.pool:
+            if not conn.task:
+                conn.task = asyncio.create_task(self._listen(conn))
+        self.logger.info(f"Started {self.pool_size} message listeners")
+
+    async def _listen(self, conn: UpstreamConnection):
+        """Continuously listen for WebSocket messages on one connection and route them"""
         while self.running:
             try:
                 # Ensure we have a connection
-                if not self.connection or not self.running:
-                    if not await self.connect():
-                        self.logger.error(f"Failed to reconnect - retrying in {self.reconnect_delay}s")
+                if not conn.connection:
+                    if not await self._connect(conn):
+                        self.logger.error(f"Failed to reconnect #{conn.index} - retrying in {self.reconnect_delay}s")
                         await asyncio.sleep(self.reconnect_delay)
                         continue
                 
                 # Listen for messages
-                message = await self.connection.recv()
-                self.logger.info(f"Received message: {message[:100]}...")
+                message = await conn.connection.recv()
+                if self.logger.is_enabled(Logger.INFO):
+                    self.logger.info("Received message on #%d: %s...", conn.index, message[:100])
                 self._route_message(message)
                 
                 # Reset retry counter on successful message
-                self.current_retry = 0
+                conn.current_retry = 0
                 
             except websockets.exceptions.ConnectionClosed as e:
-                self.logger.warn(f"WebSocket connection closed: {str(e)}")
-                await self.close()
-                continue
-                
-            except websockets.exceptions.ConnectionClosedError as e:
-                self.logger.error(f"WebSocket connection error: {str(e)}")
-                await self.close()
+                self.logger.warn(f"WebSocket connection #{conn.index} closed: {str(e)}")
+                await self._close_connection(conn)
                 continue
                 
             except asyncio.CancelledError:
-                self.logger.info("Message listener cancelled")
+                self.logger.info(f"Message listener #{conn.index} cancelled")
                 break
                 
             except Exception as e:
-                self.logger.error(f"Error processing message: {str(e)}")
-                self.current_retry += 1
-                if self.current_retry >= self.max_retries:
-                    self.logger.error(f"Max retries reached - stopping listener")
+                self.logger.error(f"Error processing message on #{conn.index}: {str(e)}")
+                conn.current_retry += 1
+                if conn.current_retry >= self.max_retries:
+                    self.logger.error(f"Max retries reached - stopping listener #{conn.index}")
                     break
                 await asyncio.sleep(self.reconnect_delay)
                 continue
         
-        self.logger.info("WebSocket message listener stopped")
-        self.running = False
+        self.logger.info(f"WebSocket message listener #{conn.index} stopped")
+        conn.task = None
 
     async def connect(self) -> bool:
+        """Connect every pooled connection that is not connected yet"""
+        results = await asyncio.gather(
+            *(self._connect(conn) for conn in self.pool if not conn.connection)
+        )
+        return all(results) or self.connection is not None
+
+    async def _connect(self, conn: UpstreamConnection) -> bool:
         try:
-            self.logger.info(f"Attempting to connect to WebSocket server at {self.url}")
-            self.connection = await websockets.connect(
+            self.logger.info(f"Attempting to connect #{conn.index} to WebSocket server at {self.url}")
+            conn.connection = await websockets.connect(
                 self.url
             )
-            self.logger.success("WebSocket connection established successfully")
-            self.current_retry = 0
+            self.logger.success(f"WebSocket connection #{conn.index} established successfully")
+            conn.current_retry = 0
+            if conn.connects:
+                metrics.UPSTREAM_RECONNECTS.inc()
+            conn.connects += 1
+            conn.generation += 1
+            self._notify_subscribers(conn)
             return True
         except websockets.exceptions.InvalidStatusCode as e:
             self.logger.error(f"Invalid status code from server: {str(e)}")
+            metrics.UPSTREAM_CONNECT_FAILURES.inc()
             return False
         except websockets.exceptions.ConnectionClosed as e:
             self.logger.error(f"Connection closed during handshake: {str(e)}")
+            metrics.UPSTREAM_CONNECT_FAILURES.inc()
             return False
         except Exception as e:
             self.logger.error(f"Failed to connect to WebSocket server: {str(e)}")
+            metrics.UPSTREAM_CONNECT_FAILURES.inc()
             return False
 
+    def subscribe(self, callback: Callable[[UpstreamConnection], None]):
+        """Call callback(conn) whenever a pooled connection is (re)established"""
+        self.subscribers.append(callback)
+
+    def _notify_subscribers(self, conn: UpstreamConnection):
+        for callback in self.subscribers:
+            try:
+                callback(conn)
+            except Exception as e:
+                self.logger.error(f"Error notifying connection subscriber: {str(e)}")
+
+    async def _close_connection(self, conn: UpstreamConnection):
+        if conn.connection:
+            try:
+                await conn.connection.close()
+                self.logger.info(f"WebSocket connection #{conn.index} closed successfully")
+            except Exception as close_error:
+                self.logger.error(f"Error during connection close: {str(close_error)}")
+        conn.connection = None
+
     async def close(self):
         try:
-            if self.connection:
-                try:
-                    await self.connection.close()
-                    self.logger.info("WebSocket connection closed successfully")
-                except Exception as close_error:
-                    self.logger.error(f"Error during connection close: {str(close_error)}")
             self.running = False
-            self.connection = None
+            await asyncio.gather(*(self._close_connection(conn) for conn in self.pool))
         except Exception as e:
             self.logger.error(f"Error closing WebSocket: {str(e)}")
 
-    async def send(self, message: str, request_id: str) -> bool:
+    def _least_loaded(self) -> UpstreamConnection:
+        """Pick the connection with the fewest in-flight requests, preferring live ones"""
+        return min(self.pool, key=lambda conn: (not conn.connected, len(conn.in_flight)))
+
+    async def send(self, message: str, request_id: str, conn: Optional[UpstreamConnection] = None,
+                   generation: Optional[int] = None) -> bool:
+        """Send a message on conn, or on the least loaded connection
+
+        With a generation the message only goes out on that generation of
+        conn: it carries session state (an authenticated wallet) that a
+        reconnected socket no longer has, so a reset connection fails the
+        send instead of reconnecting.
+        """
+        if conn is None:
+            conn = self._least_loaded()
+        if generation is not None and (not conn.connection or conn.generation != generation):
+            self.logger.error(f"Failed to send message - upstream connection #{conn.index} was reset")
+            return False
         try:
-            if not self.connection or not self.running:
-                if not await self.connect():
+            if not conn.connection:
+                if not await self._connect(conn):
                     self.logger.error("Failed to send message - WebSocket connection not available")
                     return False
             
-            await self.connection.send(message)
-            self.logger.info(f"Sent message (request_id: {request_id}): {message[:100]}...")
+            conn.in_flight.add(request_id)
+            self.routes[request_id] = conn
+            self.sent_at[request_id] = time.perf_counter()
+            await conn.connection.send(message)
+            if self.logger.is_enabled(Logger.INFO):
+                self.logger.info("Sent message on #%d (request_id: %s): %s...", conn.index, request_id, message[:100])
             return True
         except Exception as e:
             self.logger.error(f"Failed to send message: {str(e)}")
-            await self.close()
+            self._release(request_id)
+            await self._close_connection(conn)
             return False
 
+    async def request(self, message: str, request_id: str, conn: Optional[UpstreamConnection] = None) -> Optional[asyncio.Future]:
+        """Register a one-shot waiter for request_id, then send the message
+
+        The waiter exists before the message leaves, so a reply can never
+        arrive ahead of it. Returns None (with the waiter removed) when the
+        send fails.
+        """
+        waiter = self.register_waiter(request_id)
+        if not await self.send(message, request_id, conn):
+            self.unregister_waiter(request_id)
+            return None
+        return waiter
+
+    def _release(self, request_id: str):
+        """Drop a request from its connection's in-flight set"""
+        self.sent_at.pop(request_id, None)
+        conn = self.routes.pop(request_id, None)
+        if conn:
+            conn.in_flight.discard(request_id)
+
     def _route_message(self, message: str):
         try:
             # Decode the message as UTF-8
@@ -134,8 +252,8 @@ class WebSocketManager:
             
             # Parse JSON with error handling
             try:
-                data = json.loads(message)
-            except json.JSONDecodeError as e:
+                data = codec.loads(message)
+            except codec.DecodeError as e:
                 self.logger.error(f"JSON decode error: {str(e)} - Message: {message[:100]}")
                 return
             
@@ -143,7 +261,20 @@ class WebSocketManager:
             if not request_id:
                 self.logger.warn("Received message without request ID")
                 return
+
+            sent = self.sent_at.pop(request_id, None)
+            if sent is not None:
+                metrics.UPSTREAM_RTT.observe(time.perf_counter() - sent)
             
+            # Non-stream requests wait on a one-shot future
+            waiter = self.waiters.pop(request_id, None)
+            if waiter is not None:
+                self._release(request_id)
+                if not waiter.done():
+                    waiter.set_result(data)
+                self.logger.info("Message resolved waiter for request_id: %s", request_id)
+                return
+
             # Check if this is a stream end message
             is_stream_end = data.get("isStreamEnd", False)
             
@@ -171,7 +302,7 @@ class WebSocketManager:
             # Put the message in the queue
             try:
                 queue.put_nowait(data)
-                self.logger.info(f"Message routed to queue for request_id: {request_id}")
+                self.logger.info("Message routed to queue for request_id: %s", request_id)
             except asyncio.QueueFull:
                 self.logger.error(f"Queue full for request_id: {request_id}")
                 return
@@ -181,7 +312,7 @@ class WebSocketManager:
             
             # Handle stream end
             if is_stream_end:
-                self.logger.info(f"Stream end detected for request_id: {request_id}")
+                self.logger.info("Stream end detected for request_id: %s", request_id)
                 self.unregister_listener(request_id)
         except Exception as e:
             self.logger.error(f"Error processing message: {str(e)}")
@@ -195,29 +326,42 @@ class WebSocketManager:
             if not queue:
                 queue = asyncio.Queue()
                 self.listeners[request_id] = queue
-                self.logger.info(f"Registered new listener for request_id: {request_id}")
+                self.logger.info("Registered new listener for request_id: %s", request_id)
             else:
-                self.logger.info(f"Using existing queue for request_id: {request_id}")
+                self.logger.info("Using existing queue for request_id: %s", request_id)
             return queue
         except Exception as e:
             self.logger.error(f"Error creating listener queue: {str(e)}")
             raise
 
+    def register_waiter(self, request_id: str) -> asyncio.Future:
+        """Register a one-shot response slot for a non-stream request_id"""
+        waiter = self.waiters.get(request_id)
+        if waiter is None:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters[request_id] = waiter
+        return waiter
+
+    def unregister_waiter(self, request_id: str):
+        self._release(request_id)
+        self.waiters.pop(request_id, None)
+
     def unregister_listener(self, request_id: str):
+        self._release(request_id)
         if request_id in self.listeners:
             del self.listeners[request_id]
-            self.logger.info(f"Unregistered listener for request_id: {request_id}")
+            self.logger.info("Unregistered listener for request_id: %s", request_id)
 
     def stop(self):
         """Stop the WebSocket manager and clean up resources"""
         self.logger.info("Stopping WebSocketManager")
         self.running = False
-        if self.task:
-            self.task.cancel()
-            try:
-                asyncio.run(self.task)
-            except asyncio.CancelledError:
-                pass
+        for conn in self.pool:
+            if conn.task:
+                conn.task.cancel()
+                conn.task = None
+            conn.in_flight.clear()
+            conn.connection = None
         
         for listener in self.listeners.values():
             try:
@@ -225,8 +369,12 @@ class WebSocketManager:
             except Exception as e:
                 self.logger.error(f"Error closing listener queue: {str(e)}")
         
+        for waiter in self.waiters.values():
+            if not waiter.done():
+                waiter.cancel()
+
         self.listeners.clear()
+        self.waiters.clear()
         self.stream_queues.clear()
-        self.authenticated_addresses.clear()
-        self.connection = None
-        self.task = None
+        self.routes.clear()
+        self.sent_at.clear()